@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import zlib
+from hashlib import blake2b
+from mmap import mmap as memory_map, ACCESS_READ
+from ..Index import SaveIndex
+
+
+__all__ = ['SaveArchive', 'DirectoryStore', 'SQLiteStore']
+
+
+class DirectoryStore(object):
+    """Keeps chunks and manifests as files: ``chunks/<2 first digits>/<hash>`` and ``saves/<name>.json``."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, 'chunks'), exist_ok=True)
+        os.makedirs(os.path.join(path, 'saves'), exist_ok=True)
+
+    def _chunk_path(self, key):
+        return os.path.join(self.path, 'chunks', key[:2], key)
+
+    def has_chunk(self, key):
+        return os.path.exists(self._chunk_path(key))
+
+    def get_chunk(self, key):
+        with open(self._chunk_path(key), 'rb') as f:
+            return f.read()
+
+    def put_chunk(self, key, data):
+        path = self._chunk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name first, so that an interrupted write never leaves a truncated chunk
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def get_manifest(self, name):
+        try:
+            with open(os.path.join(self.path, 'saves', name + '.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(name)
+
+    def put_manifest(self, name, manifest):
+        path = os.path.join(self.path, 'saves', name + '.json')
+        # Replaced at once like the chunks, so that an interrupted write keeps the previous manifest or none
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    def names(self):
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.path, 'saves')) if name.endswith('.json'))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStore(object):
+    """Keeps chunks and manifests in two tables of an SQLite database file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, data BLOB NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS saves (name TEXT PRIMARY KEY, manifest TEXT NOT NULL)')
+
+    def has_chunk(self, key):
+        return self.connection.execute('SELECT 1 FROM chunks WHERE key = ?', (key,)).fetchone() is not None
+
+    def get_chunk(self, key):
+        row = self.connection.execute('SELECT data FROM chunks WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def put_chunk(self, key, data):
+        self.connection.execute('INSERT OR IGNORE INTO chunks VALUES (?, ?)', (key, data))
+
+    def get_manifest(self, name):
+        row = self.connection.execute('SELECT manifest FROM saves WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return json.loads(row[0])
+
+    def put_manifest(self, name, manifest):
+        self.connection.execute('INSERT OR REPLACE INTO saves VALUES (?, ?)', (name, json.dumps(manifest)))
+
+    def names(self):
+        return [row[0] for row in self.connection.execute('SELECT name FROM saves ORDER BY name')]
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class SaveArchive(object):
+    """A deduplicating store of save files.
+
+    Each save is split into chunks along the boundaries of its subtrees (``chunk_paths``, see ``SaveIndex``), large
+    subtrees being cut further into pieces of ``max_chunk_size`` bytes, and the chunks are stored compressed under
+    the hash of their content, so that subtrees which did not change between two saves are stored once. A save is
+    kept as the list of the hashes of its chunks and is rebuilt byte for byte from them.
+
+    ``path`` is a directory, or an SQLite database file when it ends with ``.sqlite`` or ``.db``.
+    """
+    chunk_paths = (
+        'screenShotPngFile',
+        'gameData.gameDesc',
+        'gameData.gameHistoryData',
+        'gameData.gameStatData',
+        'gameData.mainPlayer',
+        'gameData.galacticTransport',
+        'gameData.planetFactory[*].*',
+        'gameData.dysonSpheres[*]',
+    )
+    # Subtrees smaller than this are stored along with their neighbours instead of as chunks of their own
+    min_chunk_size = 4096
+    # Larger chunks (mostly pools) are cut into pieces of this size, so that an edit only stores the piece it is in
+    max_chunk_size = 1 << 18
+
+    def __init__(self, path, compression=6):
+        if path.endswith(('.sqlite', '.db')):
+            self.store = SQLiteStore(path)
+        else:
+            self.store = DirectoryStore(path)
+        self.compression = compression
+
+    def add(self, source, name=None):
+        """Adds a save, given as a file path or a buffer, under a name (by default the file name of the path).
+
+        Returns the number of bytes of the chunks that were not in the archive yet, before compression.
+        """
+        if isinstance(source, str):
+            if name is None:
+                name = os.path.basename(source)
+            with open(source, 'rb') as f:
+                buffer = memory_map(f.fileno(), 0, access=ACCESS_READ)
+            try:
+                return self._add(buffer, name)
+            finally:
+                buffer.close()
+        if name is None:
+            raise ValueError('A name is needed to add a save given as a buffer')
+        return self._add(source, name)
+
+    def _add(self, buffer, name):
+        keys = []
+        added = 0
+        view = memoryview(buffer)
+        for start, end in self.split(buffer):
+            key = blake2b(view[start:end], digest_size=20).hexdigest()
+            if not self.store.has_chunk(key):
+                self.store.put_chunk(key, zlib.compress(view[start:end], self.compression))
+                added += end - start
+            keys.append(key)
+        self.store.put_manifest(name, {'size': len(buffer), 'chunks': keys})
+        self.store.commit()
+        return added
+
+    def split(self, buffer):
+        """Returns the ``(start, end)`` offsets of the chunks a save is stored as; they cover the whole save."""
+        entries = SaveIndex.build(buffer, self.chunk_paths).entries
+        spans = sorted((start, start + length) for start, length in entries.values() if length >= self.min_chunk_size)
+        bounds = []
+        position = 0
+        for start, end in spans:
+            if start < position:
+                continue
+            if start > position:
+                bounds.append((position, start))
+            bounds.append((start, end))
+            position = end
+        if position < len(buffer):
+            bounds.append((position, len(buffer)))
+        return [(offset, min(offset + self.max_chunk_size, end))
+                for start, end in bounds for offset in range(start, end, self.max_chunk_size)]
+
+    def get(self, name):
+        """Rebuilds the save stored under a name and returns its bytes."""
+        manifest = self.store.get_manifest(name)
+        data = b''.join([zlib.decompress(self.store.get_chunk(key)) for key in manifest['chunks']])
+        if len(data) != manifest['size']:
+            raise ValueError('The chunks of {0} do not add up to its size'.format(name))
+        return data
+
+    def extract(self, name, path):
+        with open(path, 'wb') as f:
+            f.write(self.get(name))
+
+    def names(self):
+        return self.store.names()
+
+    def __contains__(self, name):
+        try:
+            self.store.get_manifest(name)
+        except KeyError:
+            return False
+        return True
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,196 @@
+import os
+import pickle
+from hashlib import blake2b
+from importlib import metadata
+from mmap import mmap as memory_map, ACCESS_READ
+from struct import Struct, error as StructError
+from ..Fields import ArrayField, ConditionalField, ModelField
+from ..Models.GameSave import GameSave
+
+
+__all__ = ['SaveCache', 'schema_fingerprint']
+
+
+# Magic bytes, format version, length of the pickle stream and number of out-of-band buffers
+_header = Struct('<4sIQI')
+_buffer_length = Struct('<Q')
+# Out-of-band buffers start at offsets aligned for any NumPy dtype
+_alignment = 64
+
+
+def _aligned(offset):
+    return -(-offset // _alignment) * _alignment
+
+
+def _model_classes(model_class, found):
+    """Collects the model classes of the tree of a model class, in a stable order."""
+    if model_class in found:
+        return found
+    found[model_class] = None
+    for fname in model_class._value_fields:
+        field = model_class._fields[fname]
+        while isinstance(field, (ConditionalField, ArrayField)):
+            field = field.field if isinstance(field, ConditionalField) else field.item_field
+        if isinstance(field, ModelField):
+            _model_classes(field.model_class, found)
+    return found
+
+
+def schema_fingerprint():
+    """Returns a hash of the fields of every model class of a save and of the version of the package, which changes
+    whenever pickled saves stop matching the classes they are loaded into.
+    """
+    try:
+        package_version = metadata.version('dsvfile')
+    except metadata.PackageNotFoundError:
+        package_version = None
+    digest = blake2b(str(package_version).encode('utf-8'), digest_size=10)
+    for model_class in _model_classes(GameSave, {}):
+        fields = ','.join('{0}:{1}'.format(fname, type(model_class._fields[fname]).__name__)
+                          for fname in model_class._value_fields)
+        digest.update('\0{0}.{1}({2})'.format(model_class.__module__, model_class.__qualname__, fields).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SaveCache(object):
+    """A directory of parsed saves, so that opening a save that did not change since its last use skips parsing.
+
+    Saves are read with columnar pools and pickled with their NumPy arrays stored out-of-band, at aligned offsets of
+    the cache file, so that they are loaded back as read-only views of a memory map of it (see ``ColumnarPool``).
+    Saves with pools of model objects are not cached, as they unpickle more slowly than they parse.
+
+    Entries are keyed by the hash of the content of the save, and looked up by path, size and modification time
+    first so that the content is only hashed when a file is seen for the first time or has
+    been touched. Once the entries take more than ``max_size`` bytes, the least recently used ones are removed.
+    Both keys include the format version and a fingerprint of the model classes (see ``schema_fingerprint``), so
+    that entries pickled before a model gained, lost or renamed a field are parsed again instead of being loaded.
+
+    Loading an entry unpickles it, which can run arbitrary code: only use cache directories that nobody else can
+    write to.
+    """
+    version = 1
+    magic = b'DSVC'
+
+    def __init__(self, path, max_size=1 << 30):
+        self.path = path
+        self.max_size = max_size
+        self.fingerprint = '{0}.{1}'.format(self.version, schema_fingerprint())
+        os.makedirs(os.path.join(path, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(path, 'refs'), exist_ok=True)
+
+    def open(self, path, workers=None):
+        """Returns the save at a path read with ``columnar=True``, from the cache when possible; otherwise parses it
+        and stores it.
+        """
+        stat = os.stat(path)
+        identity = '{0}\0{1}\0{2}\0{3}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, self.fingerprint)
+        ref_path = os.path.join(self.path, 'refs', blake2b(identity.encode('utf-8'), digest_size=20).hexdigest())
+        key = self._read_ref(ref_path)
+        if key is None or not os.path.exists(self._entry_path(key)):
+            key = self._content_key(path)
+            self._write_ref(ref_path, key)
+        entry_path = self._entry_path(key)
+        try:
+            save = self.load_entry(entry_path)
+        except (OSError, ValueError, StructError, pickle.UnpicklingError):
+            save = GameSave.open(path, mmap=False, workers=workers, columnar=True, zero_copy=False)
+            save._buffer = None
+            self.store_entry(entry_path, save)
+            self.evict()
+        else:
+            # The modification time of an entry is its last use, for the eviction
+            os.utime(entry_path)
+        return save
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, 'entries', key)
+
+    def _content_key(self, path):
+        digest = blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                buffer = memory_map(f.fileno(), 0, access=ACCESS_READ)
+                try:
+                    digest.update(buffer)
+                finally:
+                    buffer.close()
+        digest.update('\0{0}'.format(self.fingerprint).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _read_ref(ref_path):
+        try:
+            with open(ref_path, 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _write_ref(ref_path, key):
+        with open(ref_path + '.tmp', 'w') as f:
+            f.write(key)
+        os.replace(ref_path + '.tmp', ref_path)
+
+    def store_entry(self, entry_path, save):
+        buffers = []
+        data = pickle.dumps(save, protocol=5, buffer_callback=buffers.append)
+        buffers = [buffer.raw() for buffer in buffers]
+        with open(entry_path + '.tmp', 'wb') as f:
+            f.write(_header.pack(self.magic, self.version, len(data), len(buffers)))
+            for buffer in buffers:
+                f.write(_buffer_length.pack(buffer.nbytes))
+            f.write(data)
+            for buffer in buffers:
+                f.write(bytes(_aligned(f.tell()) - f.tell()))
+                f.write(buffer)
+        os.replace(entry_path + '.tmp', entry_path)
+
+    def load_entry(self, entry_path):
+        with open(entry_path, 'rb') as f:
+            buffer = memory_map(f.fileno(), 0, access=ACCESS_READ)
+        view = memoryview(buffer)
+        magic, version, length, count = _header.unpack_from(buffer)
+        if magic != self.magic or version != self.version:
+            raise ValueError('{0} is not a cache entry of this version'.format(entry_path))
+        position = _header.size
+        lengths = []
+        for index in range(count):
+            lengths.append(_buffer_length.unpack_from(buffer, position)[0])
+            position += _buffer_length.size
+        data = view[position:position + length]
+        position += length
+        buffers = []
+        for buffer_length in lengths:
+            position = _aligned(position)
+            buffers.append(view[position:position + buffer_length])
+            position += buffer_length
+        save = pickle.loads(data, buffers=buffers)
+        save._buffer = buffer
+        return save
+
+    def evict(self):
+        """Removes the least recently used entries until the entries take at most ``max_size`` bytes."""
+        directory = os.path.join(self.path, 'entries')
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for mtime, size, path in entries)
+        removed = set()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            removed.add(os.path.basename(path))
+            total -= size
+        if removed:
+            for entry in os.scandir(os.path.join(self.path, 'refs')):
+                if self._read_ref(entry.path) in removed:
+                    os.remove(entry.path)
+
+    def clear(self):
+        for directory in ('entries', 'refs'):
+            for entry in os.scandir(os.path.join(self.path, directory)):
+                os.remove(entry.path)
@@ -0,0 +1,369 @@
+import linecache
+from struct import Struct
+from ..Fields import ArrayField, ByteStringField, ConditionalBlockEnd, ConditionalBlockStart, ConditionalField, \
+    FieldRun, ModelField, StringField
+from ..Streams import Unloaded
+from ..Tracking import TrackedMixin
+
+
+__all__ = ['generate', 'compiled']
+
+
+class _Generator(object):
+    """Emits the source of one generated function along with the namespace of the constants it refers to.
+
+    Consecutive fixed-size values (field runs, single numbers and length prefixes) are buffered in ``pending``
+    and flushed as a single struct call before anything that is not fixed-size is emitted.
+    """
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.namespace = {}
+        self.lines = []
+        self.indent = 1
+        self.pending = []
+        self.locals = 0
+
+    def constant(self, value, prefix='c'):
+        for name, existing in self.namespace.items():
+            if existing is value:
+                return name
+        name = '_{0}{1}'.format(prefix, len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def local(self, prefix):
+        self.locals += 1
+        return '{0}{1}'.format(prefix, self.locals)
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def open_block(self, line):
+        self.flush()
+        self.emit(line)
+        self.indent += 1
+        return len(self.lines)
+
+    def close_block(self, opened_at):
+        self.flush()
+        if len(self.lines) == opened_at:
+            self.emit('pass')
+        self.indent -= 1
+
+    def condition(self, field):
+        """Returns the expression of the condition of a conditional field or block."""
+        if field.condition_func is None:
+            return 'True'
+        args = ['self.' + name for name in field.arg_fields]
+        expression = getattr(field.condition_func, 'expression', None)
+        if expression is not None and len(args) == 1:
+            return expression.format(args[0])
+        return '{0}({1})'.format(self.constant(field.condition_func, 'f'), ', '.join(args))
+
+    def stored_length(self, field):
+        """Returns the expression of the length of an array or byte string held by a sibling field."""
+        length = 'self.' + field.length_field
+        if field.length_func is None:
+            return length
+        expression = getattr(field.length_func, 'expression', None)
+        if expression is not None:
+            return expression.format(length)
+        return '{0}({1})'.format(self.constant(field.length_func, 'f'), length)
+
+    def nested(self, model_class, kind):
+        """Returns the name of the function reading or writing a nested model."""
+        from ..Models import Model
+        if model_class.codegen and getattr(model_class, kind) is getattr(Model, kind):
+            return self.constant(compiled(model_class, kind), kind)
+        return None
+
+    def function(self, signature):
+        source = 'def {0}:\n'.format(signature) + '\n'.join(self.lines) + '\n'
+        return source, self.namespace
+
+
+class _ReadGenerator(_Generator):
+    def generate(self):
+        self.emit('_read = input_stream.read')
+        self.emit('_unpack = input_stream.unpack')
+        block = None
+        for fname, field in self.model_class._steps:
+            if isinstance(field, FieldRun):
+                self.pending.extend(('self.' + name, run_field.fmt) for name, run_field in zip(fname, field.fields))
+                if block is not None:
+                    block[1].extend(fname)
+            elif isinstance(field, (ConditionalBlockStart, ConditionalBlockEnd)):
+                self.end_block(block)
+                block = None
+                if isinstance(field, ConditionalBlockStart):
+                    block = (self.open_block('if {0}:'.format(self.condition(field))), [])
+            elif field.store_value:
+                self.read_field('self.' + fname, field)
+                if block is not None:
+                    block[1].append(fname)
+        self.end_block(block)
+        self.flush()
+        return self.function('read(self, input_stream)')
+
+    def end_block(self, block):
+        if block is None:
+            return
+        opened_at, names = block
+        self.close_block(opened_at)
+        if names:
+            self.emit('else:')
+            self.indent += 1
+            self.emit(' = '.join('self.' + name for name in names) + ' = None')
+            self.indent -= 1
+
+    def flush(self):
+        if not self.pending:
+            return
+        targets, fmts = zip(*self.pending)
+        del self.pending[:]
+        struct = Struct('<' + ''.join(fmt.lstrip('<') for fmt in fmts))
+        self.emit('{0}, = _unpack({1})'.format(', '.join(targets), self.constant(struct, 's')))
+
+    def read_length(self, field):
+        if isinstance(field.length_field, str):
+            self.flush()
+            return self.stored_length(field)
+        length = self.local('n')
+        if field.length_field.fmt is not None:
+            self.pending.append((length, field.length_field.fmt))
+            self.flush()
+        else:
+            self.emit('{0} = {1}.read(input_stream, self)'.format(length, self.constant(field.length_field, 'f')))
+        return length
+
+    def read_field(self, target, field):
+        if field.fmt is not None:
+            self.pending.append((target, field.fmt))
+        elif isinstance(field, ConditionalField):
+            opened_at = self.open_block('if {0}:'.format(self.condition(field)))
+            self.read_field(target, field.field)
+            self.close_block(opened_at)
+            self.emit('else:')
+            self.emit('    {0} = None'.format(target))
+        elif isinstance(field, ModelField) and not field.lazy:
+            self.flush()
+            model_class = self.constant(field.model_class, 'm')
+            item = self.local('m')
+            self.emit('{0} = {1}.__new__({1})'.format(item, model_class))
+            self.read_model(item, field.model_class)
+            self.emit('{0} = {1}'.format(target, item))
+        elif isinstance(field, ArrayField):
+            length = self.read_length(field)
+            item_field = field.item_field
+            if isinstance(item_field, ModelField) and item_field.size is None and not item_field.lazy:
+                model_class = self.constant(item_field.model_class, 'm')
+                items, item = self.local('a'), self.local('m')
+                self.emit('{0} = []'.format(items))
+                self.emit('for _ in range({0}):'.format(length))
+                self.indent += 1
+                self.emit('{0} = {1}.__new__({1})'.format(item, model_class))
+                self.read_model(item, item_field.model_class)
+                self.emit('{0}.append({1})'.format(items, item))
+                self.indent -= 1
+                self.emit('{0} = {1}'.format(target, items))
+            else:
+                self.emit('{0} = {1}.read_array(input_stream, {2}, self)'.format(
+                    target, self.constant(item_field, 'f'), length))
+        elif isinstance(field, ByteStringField):
+            self.emit('{0} = _read({1})'.format(target, self.read_length(field)))
+        elif isinstance(field, StringField):
+            self.flush()
+            self.emit('{0} = str(_read(_read(1)[0]), {1!r})'.format(target, field.encoding))
+        else:
+            self.flush()
+            self.emit('{0} = {1}.read(input_stream, self)'.format(target, self.constant(field, 'f')))
+
+    def read_model(self, item, model_class):
+        if model_class._struct is not None:
+            self.emit('{0}, = _unpack({1})'.format(', '.join(item + '.' + name for name in model_class._value_fields),
+                                                   self.constant(model_class._struct, 's')))
+            return
+        reader = self.nested(model_class, 'read')
+        if reader is not None:
+            self.emit('{0}({1}, input_stream)'.format(reader, item))
+        else:
+            self.emit('{0}.read(input_stream)'.format(item))
+
+
+class _WriteGenerator(_Generator):
+    def generate(self):
+        self.emit('_write = output_stream.write')
+        opened_at = None
+        for fname, field in self.model_class._steps:
+            if isinstance(field, FieldRun):
+                self.pending.extend(('self.' + name, run_field.fmt) for name, run_field in zip(fname, field.fields))
+            elif isinstance(field, (ConditionalBlockStart, ConditionalBlockEnd)):
+                if opened_at is not None:
+                    self.close_block(opened_at)
+                    opened_at = None
+                if isinstance(field, ConditionalBlockStart):
+                    opened_at = self.open_block('if {0}:'.format(self.condition(field)))
+            elif field.write_value:
+                self.write_field('self.' + fname, field)
+        if opened_at is not None:
+            self.close_block(opened_at)
+        self.flush()
+        return self.function('write(self, output_stream)')
+
+    def flush(self):
+        if not self.pending:
+            return
+        values, fmts = zip(*self.pending)
+        del self.pending[:]
+        struct = Struct('<' + ''.join(fmt.lstrip('<') for fmt in fmts))
+        self.emit('_write({0}.pack({1}))'.format(self.constant(struct, 's'), ', '.join(values)))
+
+    def write_length(self, value, field):
+        if isinstance(field.length_field, str):
+            self.flush()
+            self.emit('if {0} != len({1}):'.format(self.stored_length(field), value))
+            self.emit('    raise ValueError({0!r})'.format(
+                'Value length does not match one specified by {0}'.format(field.length_field)))
+        elif field.length_field.fmt is not None:
+            self.pending.append(('len({0})'.format(value), field.length_field.fmt))
+        else:
+            self.flush()
+            self.emit('{0}.write(len({1}), output_stream, self)'.format(
+                self.constant(field.length_field, 'f'), value))
+
+    def write_field(self, value, field):
+        if field.fmt is not None:
+            self.pending.append((value, field.fmt))
+        elif isinstance(field, ConditionalField):
+            opened_at = self.open_block('if {0}:'.format(self.condition(field)))
+            self.write_field(value, field.field)
+            self.close_block(opened_at)
+        elif isinstance(field, ModelField):
+            self.flush()
+            item = self.local('m')
+            self.emit('{0} = {1}'.format(item, value))
+            self.emit('if {0}:'.format(item))
+            self.indent += 1
+            self.write_model(item, field.model_class)
+            self.indent -= 1
+        elif isinstance(field, ArrayField):
+            self.flush()
+            items = self.local('a')
+            self.emit('{0} = {1}'.format(items, value))
+            self.emit('if isinstance({0}, {1}) and {0}.raw is not None:'.format(
+                items, self.constant((Unloaded, TrackedMixin), 'u')))
+            self.emit('    _write({0}.raw)'.format(items))
+            self.emit('else:')
+            self.indent += 1
+            self.write_length(items, field)
+            self.flush()
+            item_field = field.item_field
+            if isinstance(item_field, ModelField) and item_field.size is None:
+                item = self.local('m')
+                self.emit('for {0} in {1}:'.format(item, items))
+                self.emit('    if {0}:'.format(item))
+                self.indent += 2
+                self.write_model(item, item_field.model_class)
+                self.indent -= 2
+            else:
+                self.emit('{0}.write_array({1}, output_stream, self)'.format(self.constant(item_field, 'f'), items))
+            self.indent -= 1
+        elif isinstance(field, ByteStringField):
+            data = self.local('b')
+            self.emit('{0} = {1}'.format(data, value))
+            self.write_length(data, field)
+            self.flush()
+            self.emit('_write({0})'.format(data))
+        elif isinstance(field, StringField):
+            data = self.local('b')
+            self.emit('{0} = {1}.encode({2!r})'.format(data, value, field.encoding))
+            self.pending.append(('len({0})'.format(data), 'B'))
+            self.flush()
+            self.emit('_write({0})'.format(data))
+        else:
+            self.flush()
+            self.emit('{0}.write({1}, output_stream, self)'.format(self.constant(field, 'f'), value))
+
+    def write_model(self, item, model_class):
+        writer = self.nested(model_class, 'write')
+        if writer is None:
+            self.emit('{0}.write(output_stream)'.format(item))
+            return
+        self.emit('if {0}.__class__ is {1}:'.format(item, self.constant(model_class, 'm')))
+        self.emit('    {0}({1}, output_stream)'.format(writer, item))
+        self.emit('else:')
+        self.emit('    {0}.write(output_stream)'.format(item))
+
+
+class _ReadItemsGenerator(_Generator):
+    def generate(self):
+        model_class = self.constant(self.model_class, 'm')
+        self.emit('items = []')
+        self.emit('append = items.append')
+        self.emit('for values in {0}.iter_unpack(data):'.format(self.constant(self.model_class._struct, 's')))
+        self.emit('    item = {0}.__new__({0})'.format(model_class))
+        self.emit('    {0}, = values'.format(', '.join('item.' + name for name in self.model_class._value_fields)))
+        self.emit('    append(item)')
+        self.emit('return items')
+        return self.function('read_items(data)')
+
+
+class _ReadTrackedItemsGenerator(_Generator):
+    def generate(self):
+        model_class = self.model_class
+        names = ['v{0}'.format(i) for i in range(len(model_class._value_fields))]
+        setters = [self.constant(getattr(model_class, fname).__set__, 'd')
+                   for fname in model_class._value_fields + ('_owner', '_span', '_dirty')]
+        self.emit('items = []')
+        self.emit('append = items.append')
+        struct = self.constant(model_class._struct, 's')
+        self.emit('for {0}, in {1}.iter_unpack(data):'.format(', '.join(names), struct))
+        self.indent += 1
+        self.emit('item = {0}.__new__({0})'.format(self.constant(model_class, 'm')))
+        for setter, value in zip(setters, names + ['owner', 'None', 'False']):
+            self.emit('{0}(item, {1})'.format(setter, value))
+        self.emit('append(item)')
+        self.indent -= 1
+        self.emit('return items')
+        return self.function('read_tracked_items(data, owner)')
+
+
+class _WriteItemsGenerator(_Generator):
+    def generate(self):
+        self.emit('return b"".join([{0}({1}) for item in items])'.format(
+            self.constant(self.model_class._struct.pack, 'p'),
+            ', '.join('item.' + name for name in self.model_class._value_fields)))
+        return self.function('write_items(items)')
+
+
+_generators = {
+    'read': _ReadGenerator,
+    'write': _WriteGenerator,
+    'read_items': _ReadItemsGenerator,
+    'read_tracked_items': _ReadTrackedItemsGenerator,
+    'write_items': _WriteItemsGenerator,
+}
+
+
+def generate(model_class, kind):
+    """Returns the source and the global namespace of a generated function for a model class.
+
+    ``kind`` is ``read`` or ``write`` (functions taking the model and the stream, like the methods of the same
+    name), ``read_items`` and ``write_items`` (functions decoding a list of instances of a fixed-layout model from
+    bytes and encoding it back), or ``read_tracked_items`` (the decoding function for the tracked variant of a
+    model class, see ``TrackedModel``).
+    """
+    return _generators[kind](model_class).generate()
+
+
+def compiled(model_class, kind):
+    """Returns the generated function of the given kind for a model class, compiling it on first use."""
+    function = model_class._compiled.get(kind)
+    if function is None:
+        source, namespace = generate(model_class, kind)
+        filename = '<dsvfile.Codegen {0}.{1}>'.format(model_class.__qualname__, kind)
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        exec(compile(source, filename, 'exec'), namespace)
+        function = model_class._compiled[kind] = namespace[kind]
+    return function
@@ -0,0 +1,122 @@
+from mmap import mmap as memory_map, ACCESS_READ
+from struct import pack_into
+from ..Fields import ArrayField, ModelField, ConditionalField
+from ..Models import Model
+from ..Models.GameSave import GameSave
+from ..Streams import BufferReader, BufferWriter
+
+
+__all__ = ['diff']
+
+
+def diff(save_a, save_b, model_class=GameSave):
+    """Compares two saves and returns the list of their differences as ``(path, value a, value b)`` tuples.
+
+    The saves are given as file paths, buffers holding them or models. Both are walked with skip passes, and the
+    byte ranges of matching fields, subtrees and array items are compared, so that only the subtrees whose bytes
+    differ are descended into. Differences are reported down to single values; ``path`` is a tuple of steps (see
+    ``dsvfile.Paths``). An array item present in only one of the saves, or a field excluded by a condition in one
+    of them, is reported with ``None`` as the missing value.
+    """
+    buffers = [_open(save) for save in (save_a, save_b)]
+    try:
+        changes = []
+        _diff_model(model_class, buffers[0], buffers[1], 0, 0, (), changes)
+        return changes
+    finally:
+        for buffer in buffers:
+            if isinstance(buffer, memory_map):
+                buffer.close()
+
+
+def _open(save):
+    if isinstance(save, str):
+        with open(save, 'rb') as f:
+            return memory_map(f.fileno(), 0, access=ACCESS_READ)
+    if isinstance(save, Model):
+        return _encode(save)
+    if isinstance(save, memoryview):
+        # Comparing slices of a memoryview goes item by item, slices of bytes and mmap objects are compared at once
+        return save.tobytes()
+    return save
+
+
+def _encode(model):
+    """Serializes a model as its ``write`` method does, without setting the ``fileStreamLength`` of a save."""
+    buffer = bytearray(model.byte_size())
+    if isinstance(model, GameSave):
+        model._write_into(buffer)
+        # The length the save would store, after the header
+        length_field = GameSave._fields['fileStreamLength']
+        pack_into(length_field.fmt, buffer, GameSave._fields['header'].byte_size(None, model), len(buffer))
+        return buffer
+    writer = BufferWriter(buffer)
+    try:
+        model.write(writer)
+    finally:
+        writer.close()
+    return buffer
+
+
+def _equal(a, b, span_a, span_b):
+    if span_a[1] - span_a[0] != span_b[1] - span_b[0]:
+        return False
+    return a[span_a[0]:span_a[1]] == b[span_b[0]:span_b[1]]
+
+
+def _scan(model_class, buffer, start):
+    model = model_class.__new__(model_class)
+    spans = {fname: (start, end) for fname, start, end in model.scan(BufferReader(buffer, start))}
+    return model, spans
+
+
+def _read(field, model, buffer, span):
+    if span is None:
+        return None
+    return field.read(BufferReader(buffer, span[0], zero_copy=False), model)
+
+
+def _diff_model(model_class, a, b, start_a, start_b, path, changes):
+    model_a, spans_a = _scan(model_class, a, start_a)
+    model_b, spans_b = _scan(model_class, b, start_b)
+    for fname in model_class._value_fields:
+        span_a, span_b = spans_a.get(fname), spans_b.get(fname)
+        if span_a is None and span_b is None:
+            continue
+        if span_a is not None and span_b is not None and _equal(a, b, span_a, span_b):
+            continue
+        _diff_field(model_class._fields[fname], model_a, model_b, a, b, span_a, span_b, path + (fname,), changes)
+
+
+def _diff_field(field, model_a, model_b, a, b, span_a, span_b, path, changes):
+    if span_a is None or span_b is None:
+        changes.append((path, _read(field, model_a, a, span_a), _read(field, model_b, b, span_b)))
+        return
+    while isinstance(field, ConditionalField):
+        if not (field._check_condition(model_a) and field._check_condition(model_b)):
+            changes.append((path, _read(field, model_a, a, span_a), _read(field, model_b, b, span_b)))
+            return
+        field = field.field
+    if isinstance(field, ModelField):
+        model_class = field.model_class
+        if model_class._struct is None:
+            _diff_model(model_class, a, b, span_a[0], span_b[0], path, changes)
+            return
+        values_a = model_class._struct.unpack_from(a, span_a[0])
+        values_b = model_class._struct.unpack_from(b, span_b[0])
+        changes.extend((path + (fname,), value_a, value_b)
+                       for fname, value_a, value_b in zip(model_class._value_fields, values_a, values_b)
+                       if value_a != value_b)
+    elif isinstance(field, ArrayField):
+        items_a = field.scan(BufferReader(a, span_a[0]), model_a)
+        items_b = field.scan(BufferReader(b, span_b[0]), model_b)
+        item_field = field.item_field
+        for index, (item_a, item_b) in enumerate(zip(items_a, items_b)):
+            if not _equal(a, b, item_a, item_b):
+                _diff_field(item_field, model_a, model_b, a, b, item_a, item_b, path + (index,), changes)
+        for index in range(len(items_b), len(items_a)):
+            changes.append((path + (index,), _read(item_field, model_a, a, items_a[index]), None))
+        for index in range(len(items_a), len(items_b)):
+            changes.append((path + (index,), None, _read(item_field, model_b, b, items_b[index])))
+    else:
+        changes.append((path, _read(field, model_a, a, span_a), _read(field, model_b, b, span_b)))
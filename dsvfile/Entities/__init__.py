@@ -0,0 +1,110 @@
+from ..Export import pool_columns
+from ..Pools import numpy
+
+
+__all__ = ['EntityIndex', 'component_pools', 'power_pools']
+
+
+# Fields of EntityData holding the id of a component of the entity, with the pool of the component
+component_pools = (
+    ('beltId', 'cargoTraffic.beltPool'),
+    ('splitterId', 'cargoTraffic.splitterPool'),
+    ('storageId', 'factoryStorage.storagePool'),
+    ('tankId', 'factoryStorage.tankPool'),
+    ('minerId', 'factorySystem.minerPool'),
+    ('inserterId', 'factorySystem.inserterPool'),
+    ('assemblerId', 'factorySystem.assemblerPool'),
+    ('fractionateId', 'factorySystem.fractionatePool'),
+    ('ejectorId', 'factorySystem.ejectorPool'),
+    ('siloId', 'factorySystem.siloPool'),
+    ('labId', 'factorySystem.labPool'),
+    ('stationId', 'planetTransport.stationPool'),
+    ('powerNodeId', 'powerSystem.nodePool'),
+    ('powerGenId', 'powerSystem.genPool'),
+    ('powerConId', 'powerSystem.consumerPool'),
+    ('powerAccId', 'powerSystem.accPool'),
+    ('powerExcId', 'powerSystem.excPool'),
+    ('monsterId', 'monsterSystem.monsterPool'),
+)
+# Pools of power components, whose networkId tells the power network of their entity
+power_pools = ('nodePool', 'genPool', 'consumerPool', 'accPool', 'excPool')
+
+
+def _lookup(mapping, key):
+    return int(mapping[key]) if 0 <= key < len(mapping) else 0
+
+
+class EntityIndex(object):
+    """Maps the entities of a planet factory to their components and back, and to their power networks.
+
+    The mappings are NumPy arrays built from the columns of the entity pool and of the component pools (see
+    ``component_pools``), so that each lookup is an array access: ``entities[pool][component id]`` is the id of the
+    entity of a component, ``components[pool][entity id]`` the id of the component of an entity in a pool, and
+    ``networks[entity id]`` the id of the power network of an entity. Ids are positions in the pools, as in the game.
+    Pools are named by the last part of their path (``assemblerPool``), and 0 stands for none, as in the saves.
+    """
+
+    def __init__(self, factory):
+        if numpy is None:
+            raise ImportError('Entity indexes require NumPy')
+        entity_class = factory._fields['entityPool'].item_field.model_class
+        entity_columns = pool_columns(entity_class, factory.entityPool)
+        used = entity_columns['id'] != 0
+        self.entities = {}
+        self.components = {}
+        self.networks = numpy.zeros(len(used), dtype='<i4')
+        self._classes = {}
+        for id_field, path in component_pools:
+            system_name, name = path.split('.')
+            system = getattr(factory, system_name)
+            items = getattr(system, name) if system is not None else None
+            model_class = factory._fields[system_name].model_class._fields[name].item_field.model_class
+            self._classes[model_class] = name
+            columns = pool_columns(model_class, [] if items is None else items)
+            prefix = ''
+            if 'entityId' not in columns:
+                # The items of storagePool and stationPool hold their component in a conditional field
+                prefix = name + '.'
+                self._classes[model_class._fields[name].field.model_class] = name
+            self.entities[name] = numpy.where(columns[prefix + 'id'] != 0, columns[prefix + 'entityId'], 0)
+            self.components[name] = numpy.where(used, entity_columns[id_field], 0)
+            if name in power_pools:
+                component_ids = self.components[name]
+                has = (component_ids > 0) & (component_ids < len(columns['networkId']))
+                self.networks[has] = columns['networkId'][component_ids[has]]
+
+    def entity_of(self, component, component_id=None):
+        """Returns the id of the entity of a component, given as a pool name and a component id or as a model of one of
+        the component pools.
+        """
+        if component_id is None:
+            name = self._pool_of(component)
+            component_id = component.id
+        else:
+            name = component
+        try:
+            mapping = self.entities[name]
+        except KeyError:
+            raise KeyError('{0} is not a pool of components of entities'.format(name))
+        return _lookup(mapping, component_id)
+
+    def _pool_of(self, component):
+        # Lazy and tracked models are instances of subclasses of their model class
+        model_class = getattr(type(component), 'model_class', type(component))
+        try:
+            return self._classes[model_class]
+        except KeyError:
+            raise TypeError('{0} is not a component of entities'.format(model_class.__name__))
+
+    def components_of(self, entity_id):
+        """Returns the ids of the components of an entity, as a dict keyed by pool name."""
+        components = {}
+        for name, mapping in self.components.items():
+            component_id = _lookup(mapping, entity_id)
+            if component_id:
+                components[name] = component_id
+        return components
+
+    def network_of(self, entity_id):
+        """Returns the id of the power network of an entity, from any of its power components, or 0."""
+        return _lookup(self.networks, entity_id)
@@ -0,0 +1,89 @@
+from ..Fields import ArrayField, ModelField, ConditionalField, ConditionalBlockStart, ConditionalBlockEnd, FieldRun
+from ..Models.GameSave import GameSave
+from ..Streams import Reader, StreamReader
+
+
+__all__ = ['ENTER', 'EXIT', 'iterparse']
+
+
+ENTER = '<enter>'
+EXIT = '<exit>'
+
+# Upper bound of the bytes of a pool read at once
+_chunk_size = 1 << 16
+
+
+def iterparse(input_stream, model_class=GameSave, **options):
+    """Walks a save in the stream, yielding ``(path, field name, value)`` events instead of building the tree.
+
+    ``path`` is the path of the model holding the field, as a tuple of steps (see ``dsvfile.Paths``). Entering
+    and leaving a model yields ``(model path, ENTER, model class)`` and ``(model path, EXIT, model class)``; the
+    fields of the model are yielded in between. Items of arrays of fixed-layout models (entities, sails, ...) are
+    yielded one by one as ``(array path, index, model)`` and not kept afterwards; other arrays of models are walked
+    item by item, and arrays of plain values are yielded whole. Only the values other fields depend on (lengths and
+    condition arguments) are held while walking a model.
+    """
+    if not isinstance(input_stream, Reader):
+        input_stream = StreamReader(input_stream, **options)
+    return _iter_model(model_class, input_stream, ())
+
+
+def _iter_model(model_class, input_stream, path):
+    yield path, ENTER, model_class
+    model = model_class.__new__(model_class)
+    references = model_class._references
+    read_field = True
+    for fname, field in model_class._steps:
+        if not (read_field or field.always_read):
+            # Fields excluded by a conditional block are reported as None, like those of a failed ConditionalField
+            if isinstance(field, FieldRun):
+                for name in fname:
+                    yield path, name, None
+            elif field.store_value:
+                yield path, fname, None
+            continue
+        if isinstance(field, FieldRun):
+            for name, value in zip(fname, field.read(input_stream, model)):
+                if name in references:
+                    setattr(model, name, value)
+                yield path, name, value
+        elif isinstance(field, ConditionalBlockStart):
+            read_field = field.read(None, model)
+        elif isinstance(field, ConditionalBlockEnd):
+            read_field = True
+        elif field.store_value:
+            yield from _iter_field(field, fname, model, input_stream, path)
+    yield path, EXIT, model_class
+
+
+def _iter_field(field, fname, model, input_stream, path):
+    while isinstance(field, ConditionalField):
+        if not field._check_condition(model):
+            yield path, fname, None
+            return
+        field = field.field
+    if isinstance(field, ModelField):
+        yield from _iter_model(field.model_class, input_stream, path + (fname,))
+    elif isinstance(field, ArrayField) and isinstance(field.item_field, ModelField):
+        model_class = field.item_field.model_class
+        length = field._read_length(input_stream, model)
+        array_path = path + (fname,)
+        if model_class._struct is None:
+            for index in range(length):
+                yield from _iter_model(model_class, input_stream, array_path + (index,))
+            return
+        names = model_class._value_fields
+        size = model_class._struct.size
+        step = max(1, _chunk_size // size)
+        for offset in range(0, length, step):
+            data = input_stream.read(size * min(step, length - offset))
+            for index, values in enumerate(model_class._struct.iter_unpack(data), offset):
+                item = model_class.__new__(model_class)
+                for name, value in zip(names, values):
+                    setattr(item, name, value)
+                yield array_path, index, item
+    else:
+        value = field.read(input_stream, model)
+        if fname in model._references:
+            setattr(model, fname, value)
+        yield path, fname, value
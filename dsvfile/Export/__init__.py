@@ -0,0 +1,353 @@
+import json
+import os
+import re
+import sqlite3
+from itertools import chain
+from ..Fields import ArrayField, ByteStringField, ModelField, ConditionalField, StringField
+from ..Models.GameData import GameData
+from ..Pools import ColumnarPool, numpy, record_dtype
+
+
+__all__ = ['pool_owners', 'unwrap', 'pool_paths', 'pool_columns', 'gather', 'columnar', 'sqlite']
+
+
+# Arrays of GameData whose items hold the exported pools, with the column identifying the item each row comes from
+pool_owners = (
+    ('planetFactory', 'planetId'),
+    ('dysonSpheres', 'starIndex'),
+)
+
+
+def unwrap(field):
+    """Returns the field wrapped by conditional fields, or the field itself."""
+    while isinstance(field, ConditionalField):
+        field = field.field
+    return field
+
+
+def pool_paths(model_class, path=()):
+    """Returns the paths of the pools (arrays of models) of a model class, with the model class of their items.
+
+    Nested models are descended into; the items of the pools are not, so pools held by pool items (such as the
+    storage of each station) are part of the columns of their pool.
+    """
+    paths = []
+    for fname in model_class._value_fields:
+        field = unwrap(model_class._fields[fname])
+        if isinstance(field, ModelField):
+            paths.extend(pool_paths(field.model_class, path + (fname,)))
+        elif isinstance(field, ArrayField) and isinstance(unwrap(field.item_field), ModelField):
+            paths.append((path + (fname,), unwrap(field.item_field).model_class))
+    return paths
+
+
+def _offsets(lengths):
+    offsets = numpy.zeros(len(lengths) + 1, dtype='<i8')
+    numpy.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def pool_columns(model_class, items, prefix=''):
+    """Returns the columns of a pool as a dict of NumPy arrays keyed by column name.
+
+    Fields of nested models become columns named ``<field>.<nested field>``, with zeros for the items where they are
+    absent. Arrays of numbers and of fixed-layout models held by the items become ``(offsets, values)`` pairs:
+    the values of item ``i`` are ``values[offsets[i]:offsets[i + 1]]``. Strings and byte strings are left out.
+    """
+    if isinstance(items, ColumnarPool):
+        return {prefix + name: items.array[name] for name in items.columns}
+    if model_class._struct is not None and None not in items:
+        array = ColumnarPool.from_models(model_class, items).array
+        return {prefix + name: array[name] for name in array.dtype.names}
+    columns = {}
+    for fname in model_class._value_fields:
+        field = unwrap(model_class._fields[fname])
+        values = [getattr(item, fname) if item is not None else None for item in items]
+        name = prefix + fname
+        if field.fmt is not None:
+            columns[name] = numpy.array([0 if value is None else value for value in values], dtype=field.dtype)
+        elif isinstance(field, ModelField):
+            columns.update(pool_columns(field.model_class, values, name + '.'))
+        elif isinstance(field, ArrayField):
+            values = [() if value is None else value for value in values]
+            item_field = unwrap(field.item_field)
+            if item_field.fmt is not None:
+                offsets = _offsets([len(value) for value in values])
+                columns[name] = (offsets, numpy.fromiter(chain.from_iterable(values), item_field.dtype, offsets[-1]))
+            elif isinstance(item_field, ModelField) and item_field.model_class._struct is not None:
+                offsets = _offsets([len(value) for value in values])
+                dtype = record_dtype(item_field.model_class)
+                getter = item_field.model_class._values_getter
+                array = numpy.concatenate([value.array if isinstance(value, ColumnarPool) else
+                                           numpy.array([getter(item) for item in value], dtype=dtype)
+                                           for value in values]) if values else numpy.zeros(0, dtype=dtype)
+                columns.update((name + '.' + column, (offsets, array[column])) for column in dtype.names)
+    return columns
+
+
+def _concatenate(chunks):
+    if not isinstance(chunks[0], tuple):
+        return numpy.concatenate(chunks)
+    bases = numpy.cumsum([0] + [offsets[-1] for offsets, values in chunks[:-1]])
+    offsets = numpy.concatenate([offsets[:-1] + base for (offsets, values), base in zip(chunks, bases)] +
+                                [[bases[-1] + chunks[-1][0][-1]]])
+    return offsets, numpy.concatenate([values for offsets, values in chunks])
+
+
+def gather(save, pools=None):
+    """Collects every pool of every planet factory and Dyson sphere of a save into columns.
+
+    Returns a dict mapping pool names (``planetFactory.factorySystem.assemblerPool``, ...,
+    ``dysonSpheres.dysonSphere.dysonSwarm.sailPoolForSave``) to the dicts of their columns (see ``pool_columns``),
+    each with a ``planetId`` (or ``starIndex`` for Dyson spheres) column telling where each row comes from.
+    With ``pools``, only the pools with these names are collected.
+    """
+    if numpy is None:
+        raise ImportError('Columnar export requires NumPy')
+    selected = pools
+    pools = {}
+    for array_name, key in pool_owners:
+        item_class = unwrap(GameData._fields[array_name].item_field).model_class
+        paths = [(path, model_class) for path, model_class in pool_paths(item_class)
+                 if selected is None or '.'.join((array_name,) + path) in selected]
+        if not paths:
+            continue
+        chunks = {path: [] for path, model_class in paths}
+        for index, owner in enumerate(getattr(save.gameData, array_name)):
+            if not owner:
+                continue
+            owner_id = owner.planetId if key == 'planetId' else index
+            for path, model_class in paths:
+                items = owner
+                for step in path:
+                    items = getattr(items, step) if items is not None else None
+                if items is None or not len(items):
+                    continue
+                columns = pool_columns(model_class, items)
+                columns[key] = numpy.full(len(items), owner_id, dtype='<i4')
+                chunks[path].append(columns)
+        for path, model_class in paths:
+            if chunks[path]:
+                pools['.'.join((array_name,) + path)] = {
+                    name: _concatenate([columns[name] for columns in chunks[path]]) for name in chunks[path][0]}
+    return pools
+
+
+def columnar(save, out_dir):
+    """Writes every pool of a save as a directory of ``.npy`` column files, which can be memory-mapped.
+
+    Each pool (see ``gather``) gets a directory named after it, holding one ``<column>.npy`` file per column, or
+    ``<column>.offsets.npy`` and ``<column>.values.npy`` for the columns of variable-length arrays. A
+    ``manifest.json`` file lists the pools, their number of rows and their columns.
+    """
+    manifest = {}
+    for pool_name, columns in gather(save).items():
+        directory = os.path.join(out_dir, pool_name)
+        os.makedirs(directory, exist_ok=True)
+        entry = manifest[pool_name] = {'columns': {}}
+        for name, column in columns.items():
+            if isinstance(column, tuple):
+                offsets, values = column
+                numpy.save(os.path.join(directory, name + '.offsets.npy'), offsets)
+                numpy.save(os.path.join(directory, name + '.values.npy'), values)
+                entry['columns'][name] = {'dtype': values.dtype.str, 'variable': True}
+            else:
+                numpy.save(os.path.join(directory, name + '.npy'), column)
+                entry['columns'][name] = {'dtype': column.dtype.str, 'variable': False}
+                entry['rows'] = len(column)
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class _Table(object):
+    """The layout of the SQLite table of a model class: parent keys, then the columns of its fields.
+
+    ``field`` is true when instances of the class are held by more than one field, which is then stored in a
+    ``field`` column; ``children`` lists the fields holding models, exported to tables of their own.
+    """
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.name = model_class.__name__
+        self.keys = []
+        self.fields = set()
+        self.items = False
+        self.columns = []
+        self.children = []
+        for fname in model_class._value_fields:
+            field = unwrap(model_class._fields[fname])
+            if isinstance(field, ArrayField) and isinstance(unwrap(field.item_field), ModelField) or \
+                    isinstance(field, ModelField):
+                self.children.append(fname)
+            elif field.fmt is not None:
+                self.columns.append((fname, 'REAL' if field.fmt.lstrip('<') in 'fd' else 'INTEGER'))
+            elif isinstance(field, StringField):
+                self.columns.append((fname, 'TEXT'))
+            elif isinstance(field, ByteStringField):
+                self.columns.append((fname, 'BLOB'))
+            else:
+                # Arrays of numbers and strings, stored as JSON
+                self.columns.append((fname, 'TEXT'))
+        self.json_columns = [index for index, (fname, kind) in enumerate(self.columns) if kind == 'TEXT' and
+                             isinstance(unwrap(model_class._fields[fname]), ArrayField)]
+        self.child_key = None
+        if self.children and 'id' in model_class._fields:
+            # StationComponent -> stationId, DysonSphereLayer -> layerId
+            self.child_key = re.findall('[A-Z][a-z0-9]*', re.sub('Component$', '', self.name))[-1].lower() + 'Id'
+
+    @property
+    def field(self):
+        return len(self.fields) > 1
+
+    def create(self, connection):
+        columns = ['"{0}" INTEGER'.format(key) for key in self.keys]
+        if self.field:
+            columns.append('field TEXT')
+        if self.items:
+            columns.append('itemIndex INTEGER')
+        columns.extend('"{0}" {1}'.format(fname, kind) for fname, kind in self.columns)
+        connection.execute('CREATE TABLE "{0}" ({1})'.format(self.name, ', '.join(columns)))
+        self.insert = 'INSERT INTO "{0}" VALUES ({1})'.format(self.name, ', '.join('?' * len(columns)))
+
+    def indexes(self, connection):
+        columns = self.keys + (['itemIndex'] if self.items else [])
+        for column in columns + [fname for fname, kind in self.columns if fname in ('id', 'entityId')]:
+            connection.execute('CREATE INDEX "{0}_{1}" ON "{0}" ("{1}")'.format(self.name, column))
+
+
+# Keys given to the models below the items of some arrays: the field of the item or the index of the item
+_item_keys = {
+    'planetFactory': ('planetId', 'planetId'),
+    'dysonSpheres': ('starIndex', None),
+}
+
+
+def _tables(model_class, keys=(), fname=None, tables=None, item=False):
+    """Lays out the tables of a model class and of the models below it, with the keys each of them gets.
+
+    ``item`` tells that the models come from an array, so that their rows record their index in it.
+    """
+    if tables is None:
+        tables = {}
+    table = tables.get(model_class)
+    if table is None:
+        table = tables[model_class] = _Table(model_class)
+    table.fields.add(fname)
+    table.items = table.items or item
+    table.keys.extend(key for key in keys if key not in table.keys and key not in model_class._fields)
+    if table.child_key is not None:
+        keys += (table.child_key,)
+    for child in table.children:
+        field = unwrap(model_class._fields[child])
+        child_keys = keys
+        is_array = isinstance(field, ArrayField)
+        if is_array:
+            if child in _item_keys:
+                child_keys += (_item_keys[child][0],)
+            field = unwrap(field.item_field)
+        _tables(field.model_class, child_keys, child, tables, is_array)
+    return tables
+
+
+class _Loader(object):
+    def __init__(self, connection, tables, batch_size):
+        self.connection = connection
+        self.tables = tables
+        self.batch_size = batch_size
+        self.pending = {table: [] for table in tables.values()}
+
+    def add(self, table, rows):
+        pending = self.pending[table]
+        pending.extend(rows)
+        if len(pending) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table):
+        self.connection.executemany(table.insert, self.pending[table])
+        del self.pending[table][:]
+
+    def prefix(self, table, keys, fname, index=None):
+        return tuple(keys.get(key) for key in table.keys) + ((fname,) if table.field else ()) + \
+            ((index,) if table.items else ())
+
+    def load(self, model, keys, fname, index=None):
+        model_class = type(model).__dict__.get('model_class', type(model))
+        table = self.tables[model_class]
+        row = [getattr(model, column, None) for column, kind in table.columns]
+        for column in table.json_columns:
+            if row[column] is not None:
+                value = row[column]
+                row[column] = json.dumps(value.tolist() if hasattr(value, 'tolist') else list(value))
+        self.add(table, [self.prefix(table, keys, fname, index) + tuple(row)])
+        if table.child_key is not None:
+            keys = dict(keys, **{table.child_key: model.id})
+        for child in table.children:
+            value = getattr(model, child, None)
+            if not value:
+                continue
+            field = unwrap(model_class._fields[child])
+            if isinstance(field, ModelField):
+                self.load(value, keys, child)
+            else:
+                self.load_array(unwrap(field.item_field).model_class, value, keys, child)
+
+    def load_array(self, model_class, items, keys, fname):
+        table = self.tables[model_class]
+        if isinstance(items, ColumnarPool) or model_class._struct is not None:
+            # The prefix without the item index, which is added to each row
+            prefix = self.prefix(table, keys, fname)[:-1]
+            if isinstance(items, ColumnarPool):
+                rows = items.array.tolist()
+            else:
+                getter = model_class._values_getter
+                rows = [getter(item) for item in items]
+            self.add(table, [prefix + (index,) + row for index, row in enumerate(rows)])
+            return
+        item_key = _item_keys.get(fname)
+        for index, item in enumerate(items):
+            if not item:
+                continue
+            if item_key is not None:
+                key, attribute = item_key
+                item_keys = dict(keys, **{key: getattr(item, attribute) if attribute else index})
+            else:
+                item_keys = keys
+            self.load(item, item_keys, fname, index)
+
+
+def sqlite(save, db_path, batch_size=100000):
+    """Exports a save to a new SQLite database, with one table per model class.
+
+    Each model becomes a row of the table of its class, preceded by the keys of the models it is part of:
+    ``planetId`` for everything below a planet factory, ``starIndex`` below a Dyson sphere, and ``<name>Id`` (such
+    as ``stationId`` or ``layerId``) below models with an ``id`` that hold other models. Classes used by several
+    fields (``Anim`` for entities and veins, ...) get a ``field`` column naming the field, and rows of models held
+    by arrays an ``itemIndex`` column with their index in the array, which joins the items of parallel pools
+    (``entityAnimPool`` and ``entityPool``, ...). Tables of classes sharing a name are prefixed with the name of
+    their module (``CargoPath.Point``). Arrays of numbers and strings are stored as JSON. Rows are inserted in
+    batches of ``batch_size`` within a single transaction without a journal, and the key, ``itemIndex``, ``id`` and
+    ``entityId`` columns are indexed once everything is loaded.
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+    tables = _tables(type(save).__dict__.get('model_class', type(save)))
+    names = [table.name for table in tables.values()]
+    for table in tables.values():
+        if names.count(table.name) > 1:
+            # Point of CargoPath and Point of DysonShell become "CargoPath.Point" and "DysonShell.Point"
+            table.name = '{0}.{1}'.format(table.model_class.__module__.rsplit('.', 1)[-1], table.name)
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        for table in tables.values():
+            table.create(connection)
+        loader = _Loader(connection, tables, batch_size)
+        loader.load(save, {}, None)
+        for table in tables.values():
+            loader.flush(table)
+            table.indexes(connection)
+        connection.commit()
+    finally:
+        connection.close()
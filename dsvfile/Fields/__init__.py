@@ -1,23 +1,48 @@
+import sys
+from array import array
 from collections.abc import Mapping
-from struct import unpack, pack
+from operator import attrgetter
+from struct import Struct, unpack, pack
+from ..Pools import ColumnarPool, numpy
+from ..Streams import ChunkWriter, Unloaded
+from ..Tracking import TrackedMixin
 
 
 __all__ = ['IncorrectHeaderException', 'Field', 'FieldMap', 'FixedHeaderField', 'UInt8Field', 'Int16Field',
            'Int32Field', 'Int64Field', 'UInt32Field', 'UInt64Field', 'FloatField', 'DoubleField', 'EnumField',
            'BoolField', 'StringField', 'ByteStringField', 'ArrayField', 'ModelField', 'ConditionalField',
-           'ConditionalBlockStart', 'ConditionalBlockEnd']
+           'ConditionalBlockStart', 'ConditionalBlockEnd', 'FieldRun']
 
 
 class IncorrectHeaderException(IOError):
     pass
 
 
+def array_typecode(typecodes, size):
+    """Returns the first of the given ``array`` typecodes whose item size matches."""
+    for typecode in typecodes:
+        if array(typecode).itemsize == size:
+            return typecode
+    return None
+
+
+def values_getter(names):
+    """Returns a function fetching the given attributes of an object as a tuple."""
+    if len(names) == 1:
+        getter = attrgetter(names[0])
+        return lambda obj: (getter(obj),)
+    return attrgetter(*names)
+
+
 class Field(object):
     __field_counter = 0
     type_name = NotImplemented
     hidden = False
     store_value = write_value = True
     always_read = False
+    size = None
+    fmt = None
+    dtype = None
 
     def __init__(self):
         self.initialization_order = Field.__field_counter
@@ -29,6 +54,33 @@ class Field(object):
     def write(self, value, output_stream, model):
         raise NotImplementedError
 
+    def skip(self, input_stream, model):
+        self.read(input_stream, model)
+
+    def byte_size(self, value, model):
+        """Returns the number of bytes ``write`` produces for the value."""
+        if self.size is not None:
+            return self.size
+        writer = ChunkWriter()
+        self.write(value, writer, model)
+        return writer.size
+
+    def references(self):
+        """Returns the names of the sibling fields this field needs to be read or skipped."""
+        return ()
+
+    def read_array(self, input_stream, length, model):
+        return [self.read(input_stream, model) for i in range(length)]
+
+    def write_array(self, value, output_stream, model):
+        for item in value:
+            self.write(item, output_stream, model)
+
+    def array_byte_size(self, value, model):
+        if self.size is not None:
+            return self.size * len(value)
+        return sum([self.byte_size(item, model) for item in value])
+
 
 class FieldMap(Mapping):
     _dict = {}
@@ -65,17 +117,22 @@ class FixedHeaderField(Field):
         super().__init__()
 
     def read(self, input_stream, model):
-        if input_stream.read(len(self.header)).decode(self.encoding) != self.header:
+        if str(input_stream.read(len(self.header)), self.encoding) != self.header:
             raise IncorrectHeaderException
         return self.header
 
     def write(self, value, output_stream, model):
         output_stream.write(self.header.encode(self.encoding))
 
+    def byte_size(self, value, model):
+        return len(self.header.encode(self.encoding))
+
+    def skip(self, input_stream, model):
+        input_stream.skip(len(self.header))
+
 
 class FixedSizeNumberField(Field):
-    size = None
-    fmt = None
+    typecode = None
 
     def read(self, input_stream, model):
         return unpack(self.fmt, input_stream.read(self.size))[0]
@@ -83,53 +140,95 @@ class FixedSizeNumberField(Field):
     def write(self, value, output_stream, model):
         output_stream.write(pack(self.fmt, value))
 
+    def skip(self, input_stream, model):
+        input_stream.skip(self.size)
+
+    def read_array(self, input_stream, length, model):
+        data = input_stream.read(self.size * length)
+        if getattr(input_stream, 'columnar', False):
+            return numpy.frombuffer(data, dtype=self.dtype, count=length)
+        if self.typecode is None:
+            return list(Struct('<{0}{1}'.format(length, self.fmt[1:])).unpack(data))
+        value = array(self.typecode)
+        value.frombytes(data)
+        if sys.byteorder == 'big':
+            value.byteswap()
+        return value
+
+    def write_array(self, value, output_stream, model):
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            output_stream.write(value.astype(self.dtype, copy=False).tobytes())
+        elif isinstance(value, array) and value.typecode == self.typecode:
+            if sys.byteorder == 'big':
+                value = array(value.typecode, value)
+                value.byteswap()
+            output_stream.write(value.tobytes())
+        else:
+            output_stream.write(Struct('<{0}{1}'.format(len(value), self.fmt[1:])).pack(*value))
+
 
 class UInt8Field(FixedSizeNumberField):
     type_name = 'uint8'
     size = 1
     fmt = '<B'
+    dtype = 'u1'
+    typecode = 'B'
 
 
 class Int16Field(FixedSizeNumberField):
     type_name = 'int16'
     size = 2
     fmt = '<h'
+    dtype = '<i2'
+    typecode = array_typecode('h', 2)
 
 
 class Int32Field(FixedSizeNumberField):
     type_name = 'int32'
     size = 4
     fmt = '<l'
+    dtype = '<i4'
+    typecode = array_typecode('il', 4)
 
 
 class Int64Field(FixedSizeNumberField):
     type_name = 'int64'
     size = 8
     fmt = '<q'
+    dtype = '<i8'
+    typecode = array_typecode('ql', 8)
 
 
 class UInt32Field(FixedSizeNumberField):
     type_name = 'uint32'
     size = 4
     fmt = '<L'
+    dtype = '<u4'
+    typecode = array_typecode('IL', 4)
 
 
 class UInt64Field(FixedSizeNumberField):
     type_name = 'uint64'
     size = 8
     fmt = '<Q'
+    dtype = '<u8'
+    typecode = array_typecode('QL', 8)
 
 
 class FloatField(FixedSizeNumberField):
     type_name = 'float'
     size = 4
     fmt = '<f'
+    dtype = '<f4'
+    typecode = array_typecode('f', 4)
 
 
 class DoubleField(FixedSizeNumberField):
     type_name = 'double'
     size = 8
     fmt = '<d'
+    dtype = '<f8'
+    typecode = array_typecode('d', 8)
 
 
 class EnumField(Field):
@@ -139,6 +238,9 @@ class EnumField(Field):
 
     def __init__(self):
         self.field = self.base_type()
+        self.size = self.field.size
+        self.fmt = self.field.fmt
+        self.dtype = self.field.dtype
         if isinstance(self.enum_values, dict):
             self.enum_values = self.enum_values
         elif isinstance(self.enum_values, (tuple, list)):
@@ -153,6 +255,15 @@ class EnumField(Field):
     def write(self, value, output_stream, model):
         self.field.write(value, output_stream, model)
 
+    def skip(self, input_stream, model):
+        input_stream.skip(self.size)
+
+    def read_array(self, input_stream, length, model):
+        return self.field.read_array(input_stream, length, model)
+
+    def write_array(self, value, output_stream, model):
+        self.field.write_array(value, output_stream, model)
+
 
 class BoolField(EnumField):
     enum_values = ('False', 'True')
@@ -168,14 +279,47 @@ class StringField(Field):
 
     def read(self, input_stream, model):
         length = input_stream.read(1)[0]
-        return input_stream.read(length).decode(self.encoding)
+        return str(input_stream.read(length), self.encoding)
 
     def write(self, value, output_stream, model):
         value = value.encode(self.encoding)
-        output_stream.write(pack('B', len(value)) + value)
+        output_stream.write(pack('B', len(value)))
+        output_stream.write(value)
+
+    def byte_size(self, value, model):
+        return 1 + len(value.encode(self.encoding))
+
+    def skip(self, input_stream, model):
+        input_stream.skip(input_stream.read(1)[0])
 
 
-class ByteStringField(Field):
+class LengthMixin(object):
+    def _read_length(self, input_stream, model):
+        if isinstance(self.length_field, str):
+            length = model.__getattribute__(self.length_field)
+            if self.length_func is not None:
+                length = self.length_func(length)
+            return length
+        return self.length_field.read(input_stream, model)
+
+    def _write_length(self, value, output_stream, model):
+        if isinstance(self.length_field, str):
+            length = model.__getattribute__(self.length_field)
+            if self.length_func is not None:
+                length = self.length_func(length)
+            if length != len(value):
+                raise ValueError('Value length does not match one specified by {0}'.format(self.length_field))
+        else:
+            self.length_field.write(len(value), output_stream, model)
+
+    def _length_size(self):
+        return 0 if isinstance(self.length_field, str) else self.length_field.size
+
+    def references(self):
+        return (self.length_field,) if isinstance(self.length_field, str) else ()
+
+
+class ByteStringField(Field, LengthMixin):
     type_name = 'bytestring'
 
     def __init__(self, format='HEX', length_field=Int32Field, length_func=None):
@@ -190,28 +334,23 @@ class ByteStringField(Field):
         super().__init__()
 
     def read(self, input_stream, model):
-        if isinstance(self.length_field, str):
-            length = model.__getattribute__(self.length_field)
-            if self.length_func is not None:
-                length = self.length_func(length)
-        else:
-            length = self.length_field.read(input_stream, model)
-        return input_stream.read(length)
+        return input_stream.read(self._read_length(input_stream, model))
 
     def write(self, value, output_stream, model):
-        if isinstance(self.length_field, str):
-            length = model.__getattribute__(self.length_field)
-            if self.length_func is not None:
-                length = self.length_func(length)
-            if length != len(value):
-                raise ValueError('Value length does not match one specified by {0}'.format(self.length_field))
-        else:
-            length = len(value)
-            self.length_field.write(length, output_stream, model)
+        self._write_length(value, output_stream, model)
         output_stream.write(value)
 
+    def byte_size(self, value, model):
+        return self._length_size() + len(value)
+
+    def skip(self, input_stream, model):
+        input_stream.skip(self._read_length(input_stream, model))
 
-class ArrayField(Field):
+    def references(self):
+        return LengthMixin.references(self)
+
+
+class ArrayField(Field, LengthMixin):
     type_name = 'array'
 
     def __init__(self, item_field, length_field=Int32Field, length_func=None, index_enum=None):
@@ -227,37 +366,71 @@ class ArrayField(Field):
         super().__init__()
 
     def read(self, input_stream, model):
-        if isinstance(self.length_field, str):
-            length = model.__getattribute__(self.length_field)
-            if self.length_func is not None:
-                length = self.length_func(length)
-        else:
-            length = self.length_field.read(input_stream, model)
-        return [self.item_field.read(input_stream, model) for i in range(length)]
+        return self.item_field.read_array(input_stream, self._read_length(input_stream, model), model)
 
     def write(self, value, output_stream, model):
-        if isinstance(self.length_field, str):
-            length = model.__getattribute__(self.length_field)
-            if self.length_func is not None:
-                length = self.length_func(length)
-            if length != len(value):
-                raise ValueError('Value length does not match one specified by {0}'.format(self.length_field))
+        if isinstance(value, (Unloaded, TrackedMixin)) and value.raw is not None:
+            output_stream.write(value.raw)
+            return
+        self._write_length(value, output_stream, model)
+        self.item_field.write_array(value, output_stream, model)
+
+    def byte_size(self, value, model):
+        if isinstance(value, Unloaded):
+            return value.end - value.start
+        if isinstance(value, TrackedMixin) and not value._dirty:
+            buffer, start, end = value._span
+            return end - start
+        return self._length_size() + self.item_field.array_byte_size(value, model)
+
+    def skip(self, input_stream, model):
+        length = self._read_length(input_stream, model)
+        if self.item_field.size is not None:
+            input_stream.skip(self.item_field.size * length)
         else:
-            length = len(value)
-            self.length_field.write(length, output_stream, model)
-        for item in value:
-            self.item_field.write(item, output_stream, model)
+            for i in range(length):
+                self.item_field.skip(input_stream, model)
+
+    def scan(self, input_stream, model):
+        """Skips the array and returns the ``(start, end)`` stream offsets of its items."""
+        length = self._read_length(input_stream, model)
+        start = input_stream.tell()
+        size = self.item_field.size
+        if size is not None:
+            input_stream.skip(size * length)
+            return [(start + i * size, start + (i + 1) * size) for i in range(length)]
+        spans = []
+        for i in range(length):
+            self.item_field.skip(input_stream, model)
+            end = input_stream.tell()
+            spans.append((start, end))
+            start = end
+        return spans
+
+    def references(self):
+        return LengthMixin.references(self) + self.item_field.references()
 
 
 class ModelField(Field):
     type_name = 'struct'
 
-    def __init__(self, model_class):
+    def __init__(self, model_class, lazy=False):
         self.model_class = model_class
+        self.lazy = lazy
+        if model_class._struct is not None:
+            self.size = model_class._struct.size
         super().__init__()
 
     def read(self, input_stream, model):
-        local_model = self.model_class()
+        if self.lazy and getattr(input_stream, 'lazy', False):
+            start = input_stream.tell()
+            self.skip(input_stream, model)
+            local_model = self.model_class.lazy(input_stream.buffer, start, input_stream.tell(),
+                                                **input_stream.options())
+            if input_stream.deferred is not None:
+                input_stream.deferred.append(local_model)
+            return local_model
+        local_model = self.model_class.__new__(self.model_class)
         local_model.read(input_stream)
         return local_model
 
@@ -265,6 +438,51 @@ class ModelField(Field):
         if value:
             value.write(output_stream)
 
+    def byte_size(self, value, model):
+        return value.byte_size() if value else 0
+
+    def skip(self, input_stream, model):
+        if self.size is not None:
+            input_stream.skip(self.size)
+        else:
+            self.model_class.__new__(self.model_class).skip(input_stream)
+
+    def read_array(self, input_stream, length, model):
+        if self.size is None:
+            return super().read_array(input_stream, length, model)
+        if getattr(input_stream, 'columnar', False):
+            return ColumnarPool.frombuffer(self.model_class, input_stream.read(self.size * length), length)
+        model_class = self.model_class
+        if model_class.codegen:
+            return model_class._compile('read_items')(input_stream.read(self.size * length))
+        names = model_class._value_fields
+        items = []
+        for values in model_class._struct.iter_unpack(input_stream.read(self.size * length)):
+            item = model_class.__new__(model_class)
+            for name, value in zip(names, values):
+                setattr(item, name, value)
+            items.append(item)
+        return items
+
+    def write_array(self, value, output_stream, model):
+        if self.size is None:
+            super().write_array(value, output_stream, model)
+            return
+        if isinstance(value, ColumnarPool):
+            output_stream.write(value.tobytes())
+            return
+        if self.model_class.codegen:
+            output_stream.write(self.model_class._compile('write_items')(value))
+            return
+        pack_values = self.model_class._struct.pack
+        getter = self.model_class._values_getter
+        output_stream.write(b''.join([pack_values(*getter(item)) for item in value]))
+
+    def array_byte_size(self, value, model):
+        if self.size is not None:
+            return self.size * len(value)
+        return sum([item.byte_size() if item else 0 for item in value])
+
 
 class ConditionMixin(object):
     def _check_condition(self, model):
@@ -290,6 +508,16 @@ class ConditionalField(Field, ConditionMixin):
         if self._check_condition(model):
             self.field.write(value, output_stream, model)
 
+    def skip(self, input_stream, model):
+        if self._check_condition(model):
+            self.field.skip(input_stream, model)
+
+    def byte_size(self, value, model):
+        return self.field.byte_size(value, model) if self._check_condition(model) else 0
+
+    def references(self):
+        return tuple(self.arg_fields) + self.field.references()
+
 
 class ConditionalBlockStart(Field, ConditionMixin):
     hidden = True
@@ -307,6 +535,9 @@ class ConditionalBlockStart(Field, ConditionMixin):
     def write(self, value, output_stream, model):
         pass
 
+    def references(self):
+        return tuple(self.arg_fields)
+
 
 class ConditionalBlockEnd(Field):
     hidden = True
@@ -318,3 +549,28 @@ class ConditionalBlockEnd(Field):
 
     def write(self, value, output_stream, model):
         pass
+
+
+class FieldRun(Field):
+    """A run of consecutive fixed-size fields decoded and encoded with a single precompiled struct."""
+    type_name = 'run'
+    hidden = True
+
+    def __init__(self, names, fields):
+        self.names = tuple(names)
+        self.fields = tuple(fields)
+        self.struct = Struct('<' + ''.join(field.fmt.lstrip('<') for field in fields))
+        self.size = self.struct.size
+        self.sizes = tuple(field.size for field in fields)
+        self.offsets = tuple(sum(self.sizes[:i]) for i in range(len(fields)))
+        self.getter = values_getter(self.names)
+        super().__init__()
+
+    def read(self, input_stream, model):
+        return input_stream.unpack(self.struct)
+
+    def write(self, value, output_stream, model):
+        output_stream.write(self.struct.pack(*value))
+
+    def skip(self, input_stream, model):
+        input_stream.skip(self.size)
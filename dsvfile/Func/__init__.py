@@ -1,26 +1,35 @@
+def inlinable(func, template, *args):
+    """Attaches to ``func`` the Python expression it computes, ``{0}`` standing for its argument.
+
+    Generated readers and writers (see ``dsvfile.Codegen``) inline the expression instead of calling the function.
+    """
+    func.expression = template.format('{0}', *[repr(arg) for arg in args])
+    return func
+
+
 def eq(arg):
-    return lambda x: x == arg
+    return inlinable(lambda x: x == arg, '({0} == {1})', arg)
 
 
 def ne(arg):
-    return lambda x: x != arg
+    return inlinable(lambda x: x != arg, '({0} != {1})', arg)
 
 
 def g(num):
-    return lambda x: x > num
+    return inlinable(lambda x: x > num, '({0} > {1})', num)
 
 
 def ge(num):
-    return lambda x: x >= num
+    return inlinable(lambda x: x >= num, '({0} >= {1})', num)
 
 
 def decr(num=1):
-    return lambda x: x - num
+    return inlinable(lambda x: x - num, '({0} - {1})', num)
 
 
 def mul(num=1):
-    return lambda x: x * num
+    return inlinable(lambda x: x * num, '({0} * {1})', num)
 
 
 def decrmul(mul=1, decr=1):
-    return lambda x: (x - decr) * mul
+    return inlinable(lambda x: (x - decr) * mul, '(({0} - {2}) * {1})', mul, decr)
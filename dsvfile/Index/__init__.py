@@ -0,0 +1,123 @@
+import json
+import os
+from mmap import mmap as memory_map, ACCESS_READ
+from ..Fields import ModelField, ConditionalField
+from ..Models.GameSave import GameSave
+from ..Paths import PathPattern, format_path, resolve_field, iter_spans
+from ..Streams import BufferReader
+
+
+__all__ = ['SaveIndex']
+
+
+class SaveIndex(object):
+    """A table of contents of a save file: the byte offset and length of its major subtrees, keyed by path.
+
+    The index is built with a skip-only pass over the file and can be stored in a sidecar file next to the
+    save (``<save path>.idx``), which stays valid as long as the size and modification time of the save match.
+    """
+    version = 1
+    suffix = '.idx'
+    default_paths = (
+        '*',
+        'gameData.gameDesc',
+        'gameData.gameHistoryData',
+        'gameData.gameStatData',
+        'gameData.mainPlayer',
+        'gameData.planetFactory[*]',
+        'gameData.planetFactory[*].cargoTraffic',
+        'gameData.planetFactory[*].factorySystem',
+        'gameData.planetFactory[*].powerSystem',
+        'gameData.planetFactory[*].planetTransport',
+        'gameData.dysonSpheres[*]',
+    )
+
+    def __init__(self, entries, size=None, mtime=None):
+        self.entries = entries
+        self.size = size
+        self.mtime = mtime
+
+    @classmethod
+    def build(cls, buffer, paths=default_paths):
+        """Builds an index of the given paths (which may contain wildcards) from a buffer holding a save."""
+        patterns = [PathPattern(path) for path in paths]
+        entries = {}
+        reader = BufferReader(buffer)
+        descend = lambda path: any(pattern.leads_to(path) for pattern in patterns)
+        for path, field, start, end in iter_spans(GameSave, reader, descend):
+            if any(pattern.matches(path) for pattern in patterns):
+                entries[format_path(path)] = (start, end - start)
+        return cls(entries, size=len(reader.buffer))
+
+    @classmethod
+    def build_file(cls, path, paths=default_paths):
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            buffer = memory_map(f.fileno(), 0, access=ACCESS_READ)
+        try:
+            index = cls.build(buffer, paths)
+        finally:
+            buffer.close()
+        index.mtime = stat.st_mtime_ns
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """Loads the sidecar index of a save file; returns None if there is none or it is out of date."""
+        try:
+            with open(path + cls.suffix, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(path)
+        if data.get('version') != cls.version or data.get('size') != stat.st_size \
+                or data.get('mtime') != stat.st_mtime_ns:
+            return None
+        return cls({key: tuple(value) for key, value in data['entries'].items()},
+                   size=data['size'], mtime=data['mtime'])
+
+    def save(self, path):
+        with open(path + self.suffix, 'w') as f:
+            json.dump({'version': self.version, 'size': self.size, 'mtime': self.mtime, 'entries': self.entries}, f)
+
+    @classmethod
+    def open(cls, path, paths=default_paths):
+        """Returns the up-to-date sidecar index of a save file, building and storing it if necessary."""
+        index = cls.load(path)
+        if index is None:
+            index = cls.build_file(path, paths)
+            index.save(path)
+        return index
+
+    def __getitem__(self, path):
+        return self.entries[path if isinstance(path, str) else format_path(path)]
+
+    def __contains__(self, path):
+        return (path if isinstance(path, str) else format_path(path)) in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, source, path, **options):
+        """Parses the subtree at an indexed path straight from its offset.
+
+        ``source`` is either a buffer or a seekable binary stream. Model subtrees are returned as model objects;
+        other fields are decoded as long as they do not depend on sibling fields.
+        """
+        offset, length = self[path]
+        if isinstance(source, (bytes, bytearray, memoryview, memory_map)):
+            reader = BufferReader(source, offset, **options)
+        else:
+            source.seek(offset)
+            reader = BufferReader(source.read(length), **options)
+        field = resolve_field(GameSave, path)
+        while isinstance(field, ConditionalField):
+            field = field.field
+        if isinstance(field, ModelField):
+            model = field.model_class()
+            model.read(reader)
+            return model
+        return field.read(reader, None)
@@ -25,6 +25,6 @@ class GameData(Model):
     mainPlayer = ModelField(Player)
     factoryCount = Int32Field()
     galacticTransport = ModelField(GalacticTransport)
-    planetFactory = ArrayField(ModelField(PlanetFactory), length_field='factoryCount')
+    planetFactory = ArrayField(ModelField(PlanetFactory, lazy=True), length_field='factoryCount')
     galaxyStarCount = Int32Field()
-    dysonSpheres = ArrayField(ModelField(DysonSphereSwitch), length_field='galaxyStarCount')
+    dysonSpheres = ArrayField(ModelField(DysonSphereSwitch, lazy=True), length_field='galaxyStarCount')
@@ -1,9 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor
+from mmap import mmap as memory_map, ACCESS_READ
 from ..Fields import FixedHeaderField, Int64Field, ByteStringField, ModelField
-from . import Model, Int32Field
+from ..Streams import BufferReader, BufferWriter, Unloaded
+from ..Tracking import TrackedMixin
+from . import Model, LazyModel, TrackedModel, Int32Field
 from .GameData import GameData
 
 
+_worker_buffers = {}
+_worker_models = []
+
+
+def _read_range(model_class, source, start, options):
+    """Parses one model in a worker process, from a byte string or from a memory-mapped file path."""
+    if isinstance(source, str):
+        buffer = _worker_buffers.get(source)
+        if buffer is None:
+            with open(source, 'rb') as f:
+                buffer = _worker_buffers[source] = memory_map(f.fileno(), 0, access=ACCESS_READ)
+    else:
+        buffer = source
+    model = model_class.__new__(model_class)
+    model.read(BufferReader(buffer, start, zero_copy=False, **options))
+    return model
+
+
+def _init_encoder(models):
+    _worker_models[:] = models
+
+
+def _encode(index):
+    """Serializes one of the models handed to a worker process by ``_init_encoder``."""
+    model = _worker_models[index]
+    buffer = bytearray(model.byte_size())
+    model.write(BufferWriter(buffer))
+    return buffer
+
+
+def _unchanged(model):
+    """Tells whether a model is written back as a copy of the bytes it was read from."""
+    if isinstance(model, LazyModel):
+        return not model.loaded
+    if isinstance(model, TrackedModel):
+        return not model.dirty and model._span is not None
+    return False
+
+
 class GameSave(Model):
+    __slots__ = ('_buffer',)
+
     header = FixedHeaderField('VFSAVE')
     fileStreamLength = Int64Field()
     saveFileFormatNumber = Int32Field()
@@ -14,3 +59,140 @@ class GameSave(Model):
     nowTicks = Int64Field()
     screenShotPngFile = ByteStringField(format='PNG')
     gameData = ModelField(GameData)
+
+    def __init__(self):
+        self._buffer = None
+        super().__init__()
+
+    def read(self, input_stream, workers=None, include=None, track=False, **options):
+        """Reads the save from a stream.
+
+        With ``workers``, planet factories and Dyson spheres are located with a skip pass first and then parsed in
+        a pool of that many processes. The workers map the file themselves when the stream comes from
+        ``GameSave.open``; otherwise the stream is loaded into memory and each worker gets a copy of its bytes.
+
+        With ``include`` or ``track`` (see ``Model.read``), the stream is loaded into memory unless it already is
+        one, so that the subtrees left unloaded or unmodified can be written back as copies of their original bytes.
+        """
+        if include is not None or track:
+            if not isinstance(input_stream, BufferReader):
+                input_stream = BufferReader(input_stream.read(), **options)
+            super().read(input_stream, include=include, track=track)
+            return
+        if not workers or options.get('lazy'):
+            super().read(input_stream, **options)
+            return
+        if not isinstance(input_stream, BufferReader):
+            input_stream = BufferReader(input_stream.read(), **options)
+        options = dict(input_stream.options(), lazy=False)
+        input_stream.lazy, input_stream.deferred = True, []
+        try:
+            super().read(input_stream)
+            deferred = input_stream.deferred
+        finally:
+            input_stream.lazy, input_stream.deferred = False, None
+        if not deferred:
+            return
+        tasks = []
+        for model in deferred:
+            buffer, start, end, model_options = model._source
+            if input_stream.path is not None:
+                tasks.append((model.model_class, input_stream.path, start, options))
+            else:
+                tasks.append((model.model_class, buffer[start:end].tobytes(), 0, options))
+        with ProcessPoolExecutor(workers) as executor:
+            for model, parsed in zip(deferred, executor.map(_read_range, *zip(*tasks))):
+                model.adopt(parsed)
+
+    def write(self, output_stream, workers=None):
+        """Writes the save to a stream.
+
+        The size of the save is computed first and stored in ``fileStreamLength``, then the save is serialized into
+        a buffer of that size and written at once. Unmodified subtrees of a save read with ``track``, ``include`` or
+        ``lazy`` are copied from the original file.
+
+        With ``workers``, planet factories and Dyson spheres are serialized in a pool of that many processes first.
+        """
+        game_data = self.gameData
+        replaced = self._encode_parallel(game_data, workers) if workers else {}
+        try:
+            self.fileStreamLength = self.byte_size()
+            buffer = bytearray(self.fileStreamLength)
+            self._write_into(buffer)
+        finally:
+            for name, value in replaced.items():
+                object.__setattr__(game_data, name, value)
+        output_stream.write(buffer)
+
+    @staticmethod
+    def _encode_parallel(game_data, workers):
+        """Serializes the modified factories and Dyson spheres in worker processes.
+
+        The arrays holding them are replaced with lists of the encoded chunks, as ``Unloaded`` values written back
+        as copies of their bytes; the replaced arrays are returned by name so that they can be put back.
+        """
+        if not game_data or _unchanged(game_data):
+            return {}
+        arrays = {}
+        models = []
+        for name in ('planetFactory', 'dysonSpheres'):
+            items = getattr(game_data, name)
+            if isinstance(items, Unloaded) or isinstance(items, TrackedMixin) and not items._dirty:
+                continue
+            indexes = [index for index, item in enumerate(items) if item and not _unchanged(item)]
+            if indexes:
+                arrays[name] = (items, indexes)
+                models.extend(items[index] for index in indexes)
+        if len(models) < 2:
+            return {}
+        # The models reach the workers through the initializer, which does not pickle them when processes are forked
+        with ProcessPoolExecutor(workers, initializer=_init_encoder, initargs=(models,)) as executor:
+            chunks = iter(list(executor.map(_encode, range(len(models)))))
+        replaced = {}
+        for name, (items, indexes) in arrays.items():
+            encoded = list(items)
+            for index in indexes:
+                chunk = next(chunks)
+                encoded[index] = Unloaded(0, len(chunk), chunk)
+            object.__setattr__(game_data, name, encoded)
+            replaced[name] = items
+        return replaced
+
+    def _write_into(self, buffer):
+        writer = BufferWriter(buffer)
+        try:
+            super().write(writer)
+        finally:
+            writer.close()
+        if writer.pos != len(buffer):
+            raise ValueError('Wrote {0} bytes instead of the {1} computed'.format(writer.pos, len(buffer)))
+
+    def query(self, pool):
+        """Returns a ``dsvfile.Query.Query`` over the rows of a pool (``assemblerPool``, ``powerSystem.genPool``,
+        ...) of every planet factory or Dyson sphere.
+        """
+        from ..Query import Query
+        return Query(self, pool)
+
+    @classmethod
+    def open(cls, path, mmap=True, workers=None, include=None, track=False, cache=None, **options):
+        """Reads a save file from the given path.
+
+        With ``mmap`` the file is memory-mapped instead of being loaded into memory, and byte string payloads
+        (``screenShotPngFile``, ``modData``, ...) are returned as zero-copy ``memoryview`` slices of it. The
+        mapping stays open as long as the returned object or any of those views are alive.
+
+        With ``cache`` (a ``dsvfile.Cache.SaveCache``), the save is taken from the cache or stored in it; it has to be
+        read with ``columnar=True``.
+        """
+        if cache is not None:
+            if not options.get('columnar') or include is not None or track or options.get('lazy'):
+                raise ValueError('Only saves read with columnar=True, without include, track or lazy, are cached')
+            return cache.open(path, workers=workers)
+        with open(path, 'rb') as f:
+            buffer = memory_map(f.fileno(), 0, access=ACCESS_READ) if mmap else f.read()
+        save = cls()
+        save.read(BufferReader(buffer, path=path if mmap else None, **options), workers=workers, include=include,
+                  track=track)
+        save._buffer = buffer
+        return save
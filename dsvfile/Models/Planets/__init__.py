@@ -42,6 +42,8 @@ class EntitySign(Model):
 
 
 class PlanetFactory(Model):
+    __slots__ = ('_indexes',)
+
     version = Int32Field()
     planetId = Int32Field()
     planetData = ModelField(PlanetData)
@@ -78,3 +80,31 @@ class PlanetFactory(Model):
     planetTransport = ModelField(PlanetTransport)
     monsterSystem = ModelField(MonsterSystem)
     platformSystem = ConditionalField(ModelField(PlatformSystem), arg_fields='version', condition_func=ge(1))
+
+    def _cached_index(self, key, build, rebuild):
+        """Returns an index of the factory built by ``build`` and kept on the instance, without marking it modified."""
+        try:
+            indexes = self._indexes
+        except AttributeError:
+            indexes = {}
+            object.__setattr__(self, '_indexes', indexes)
+        if rebuild or key not in indexes:
+            indexes[key] = build()
+        return indexes[key]
+
+    def spatial_index(self, pool='entityPool', rebuild=False):
+        """Returns a ``dsvfile.Spatial.SpatialIndex`` of the positions of the items of ``entityPool``, ``prebuildPool``,
+        ``vegePool`` or ``veinPool``. It is built on first use and kept; pass ``rebuild`` after moving items.
+        """
+        from ...Spatial import SpatialIndex
+        if pool not in ('entityPool', 'prebuildPool', 'vegePool', 'veinPool'):
+            raise ValueError('{0} does not hold positions'.format(pool))
+        model_class = self._fields[pool].item_field.model_class
+        return self._cached_index(pool, lambda: SpatialIndex.from_pool(model_class, getattr(self, pool)), rebuild)
+
+    def entity_index(self, rebuild=False):
+        """Returns a ``dsvfile.Entities.EntityIndex`` of the links between the entities of the factory, their components
+        and power networks. It is built on first use and kept; pass ``rebuild`` after adding or removing entities.
+        """
+        from ...Entities import EntityIndex
+        return self._cached_index('entities', lambda: EntityIndex(self), rebuild)
@@ -1,55 +1,276 @@
-from ..Fields import Field, FieldMap, Int32Field, ConditionalBlockStart, ConditionalBlockEnd
+from array import array
+from struct import Struct
+from ..Fields import Field, FieldMap, FieldRun, Int32Field, ArrayField, ModelField, ConditionalField, \
+    ConditionalBlockStart, ConditionalBlockEnd, values_getter
+from ..Streams import Reader, StreamReader, BufferReader, Unloaded
+from ..Codegen import compiled
+from ..Paths import PathPattern
+from ..Tracking import touch, TrackedList, TrackedArray
 
 
-__all__ = ['Model', 'Int32KVP']
+__all__ = ['ModelMeta', 'Model', 'LazyModel', 'TrackedModel', 'Unloaded', 'Int32KVP']
 
 
-class Model(object):
-    _field_values = {}
+class ModelMeta(type):
+    """Compiles the field schema of a model class once, when the class is created.
+
+    Field declarations are removed from the class namespace and replaced by ``__slots__`` of the same names,
+    so instances store their values directly instead of going through a per-instance dict. Consecutive
+    fixed-size fields are merged into ``FieldRun`` steps that are decoded and encoded with a single struct.
+    Functions generated for the class by ``dsvfile.Codegen`` are cached in its ``_compiled`` dict.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = {fname: field for fname, field in namespace.items() if isinstance(field, Field)}
+        if not fields and any(getattr(base, '_ordered_fields', None) for base in bases):
+            # A subclass declaring no fields of its own keeps the schema of its parent
+            namespace['_compiled'] = {}
+            return super().__new__(mcs, name, bases, namespace)
+        ordered_fields = tuple(sorted(fields.items(), key=lambda c: c[1].initialization_order))
+        for fname in fields:
+            del namespace[fname]
+        value_fields = tuple(fname for fname, field in ordered_fields if field.store_value)
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + value_fields
+        namespace['_ordered_fields'] = ordered_fields
+        namespace['_fields'] = FieldMap(fields)
+        namespace['_open_fields'] = tuple(fname for fname, field in ordered_fields if not field.hidden)
+        namespace['_value_fields'] = value_fields
+        namespace['_steps'] = mcs._compile_steps(ordered_fields)
+        namespace['_compiled'] = {}
+        namespace['_references'] = frozenset(ref for fname, field in ordered_fields for ref in field.references())
+        if ordered_fields and all(field.fmt is not None and field.store_value for fname, field in ordered_fields):
+            namespace['_struct'] = Struct('<' + ''.join(field.fmt.lstrip('<') for fname, field in ordered_fields))
+            namespace['_values_getter'] = staticmethod(values_getter(value_fields))
+        else:
+            namespace['_struct'] = None
+        return super().__new__(mcs, name, bases, namespace)
+
+    @staticmethod
+    def _compile_steps(ordered_fields):
+        steps = []
+        run = []
+
+        def flush():
+            if len(run) > 1:
+                steps.append((tuple(fname for fname, field in run), FieldRun(*zip(*run))))
+            else:
+                steps.extend(run)
+            del run[:]
+
+        for fname, field in ordered_fields:
+            if field.fmt is not None and field.store_value:
+                run.append((fname, field))
+            else:
+                flush()
+                steps.append((fname, field))
+        flush()
+        return tuple(steps)
+
+
+class Model(object, metaclass=ModelMeta):
+    # Read and write through functions generated for each class instead of interpreting its steps
+    codegen = False
+    _compile = classmethod(compiled)
 
     def __init__(self):
-        fields = {fname: field for fname, field in self.__class__.__dict__.items() if isinstance(field, Field)}
-        ordered_fields = sorted(((fname, field) for fname, field in fields.items()),
-                                key=lambda c: c[1].initialization_order)
-        self._ordered_fields = ordered_fields
-        self._fields = FieldMap(fields)
-        self._open_fields = tuple(fname for fname, field in ordered_fields if not field.hidden)
-        self._field_values = {fname: None for fname, field in ordered_fields if field.store_value}
-
-    def read(self, input_stream):
+        for fname in self._value_fields:
+            setattr(self, fname, None)
+
+    def read(self, input_stream, include=None, track=False, **options):
+        """Reads the model from a stream.
+
+        With ``include``, a list of path patterns relative to the model (see ``dsvfile.Paths``), only the matching
+        subtrees are parsed. Nested models and arrays outside of them are skipped and set to ``Unloaded`` markers;
+        fixed-size values and the models on the way to the matching subtrees are read as usual.
+
+        With ``track``, nested models, arrays and pool items are tracked instances that remember the bytes they
+        were read from and are marked as modified, along with everything containing them, when they are changed.
+        Unmodified ones are written back as copies of their original bytes. Tracking requires reading from a
+        buffer and does not support columnar pools.
+        """
+        if not isinstance(input_stream, Reader):
+            input_stream = StreamReader(input_stream, **options)
+        if include is not None:
+            self._read_projected(input_stream, [PathPattern(pattern) for pattern in include], ())
+            return
+        if track:
+            if not isinstance(input_stream, BufferReader):
+                raise ValueError('Tracked reading requires a buffer, use BufferReader or GameSave.open')
+            if input_stream.columnar:
+                raise ValueError('Tracked reading does not support columnar pools')
+            self._read_tracked(input_stream)
+            return
+        if self.codegen:
+            self._compile('read')(self, input_stream)
+            return
+        read_field = True
+        for fname, field in self._steps:
+            if not (read_field or field.always_read):
+                if isinstance(field, FieldRun):
+                    for name in fname:
+                        setattr(self, name, None)
+                elif field.store_value:
+                    setattr(self, fname, None)
+                continue
+            if isinstance(field, FieldRun):
+                for name, value in zip(fname, field.read(input_stream, self)):
+                    setattr(self, name, value)
+            elif isinstance(field, ConditionalBlockStart):
+                read_field = field.read(None, self)
+            elif isinstance(field, ConditionalBlockEnd):
+                read_field = True
+            elif field.store_value:
+                setattr(self, fname, field.read(input_stream, self))
+
+    def _read_projected(self, input_stream, patterns, path):
+        read_field = True
+        for fname, field in self._steps:
+            if not (read_field or field.always_read):
+                if isinstance(field, FieldRun):
+                    for name in fname:
+                        setattr(self, name, None)
+                elif field.store_value:
+                    setattr(self, fname, None)
+                continue
+            if isinstance(field, FieldRun):
+                for name, value in zip(fname, field.read(input_stream, self)):
+                    setattr(self, name, value)
+            elif isinstance(field, ConditionalBlockStart):
+                read_field = field.read(None, self)
+            elif isinstance(field, ConditionalBlockEnd):
+                read_field = True
+            elif field.store_value:
+                setattr(self, fname, _read_projected_field(field, self, input_stream, patterns, path + (fname,)))
+
+    def _read_tracked(self, input_stream):
         read_field = True
-        for fname, field in self._ordered_fields:
+        for fname, field in self._steps:
             if not (read_field or field.always_read):
+                if isinstance(field, FieldRun):
+                    for name in fname:
+                        setattr(self, name, None)
+                elif field.store_value:
+                    setattr(self, fname, None)
                 continue
-            if isinstance(field, ConditionalBlockStart):
+            if isinstance(field, FieldRun):
+                for name, value in zip(fname, field.read(input_stream, self)):
+                    setattr(self, name, value)
+            elif isinstance(field, ConditionalBlockStart):
                 read_field = field.read(None, self)
             elif isinstance(field, ConditionalBlockEnd):
                 read_field = True
             elif field.store_value:
-                self._field_values[fname] = field.read(input_stream, self)
+                setattr(self, fname, _read_tracked_field(field, self, input_stream))
+
+    def skip(self, input_stream):
+        """Advances the stream past the model without decoding it.
+
+        Only the fields other fields depend on (lengths and condition arguments) are decoded and stored.
+        """
+        if not isinstance(input_stream, Reader):
+            input_stream = StreamReader(input_stream)
+        self._skip(input_stream, None)
+
+    def scan(self, input_stream):
+        """Skips the model like ``skip`` and returns the ``(field name, start, end)`` stream offsets of its fields.
+
+        Fields excluded by a conditional block are not listed; a ``ConditionalField`` whose condition does not
+        hold is listed with an empty range.
+        """
+        if not isinstance(input_stream, Reader):
+            input_stream = StreamReader(input_stream)
+        spans = []
+        self._skip(input_stream, spans)
+        return spans
+
+    def _skip(self, input_stream, spans):
+        references = self._references
+        read_field = True
+        for fname, field in self._steps:
+            if not (read_field or field.always_read):
+                continue
+            if isinstance(field, FieldRun):
+                if spans is not None:
+                    start = input_stream.tell()
+                    spans.extend((name, start + offset, start + offset + size)
+                                 for name, offset, size in zip(fname, field.offsets, field.sizes))
+                if references.isdisjoint(fname):
+                    field.skip(input_stream, self)
+                else:
+                    for name, value in zip(fname, field.read(input_stream, self)):
+                        setattr(self, name, value)
+            elif isinstance(field, ConditionalBlockStart):
+                read_field = field.read(None, self)
+            elif isinstance(field, ConditionalBlockEnd):
+                read_field = True
+            elif field.store_value:
+                start = input_stream.tell() if spans is not None else None
+                if fname in references:
+                    setattr(self, fname, field.read(input_stream, self))
+                else:
+                    field.skip(input_stream, self)
+                if spans is not None:
+                    spans.append((fname, start, input_stream.tell()))
 
     def write(self, output_stream):
+        if self.codegen:
+            self._compile('write')(self, output_stream)
+            return
         write_field = True
-        for fname, field in self._ordered_fields:
+        for fname, field in self._steps:
             if not (write_field or field.always_read):
                 continue
-            if isinstance(field, ConditionalBlockStart):
+            if isinstance(field, FieldRun):
+                field.write(field.getter(self), output_stream, self)
+            elif isinstance(field, ConditionalBlockStart):
                 write_field = field.read(None, self)
             elif isinstance(field, ConditionalBlockEnd):
                 write_field = True
             elif field.write_value:
-                field.write(self._field_values[fname], output_stream, self)
+                field.write(getattr(self, fname), output_stream, self)
 
-    def __getattribute__(self, name):
-        if name != '_field_values' and name in self._field_values:
-            return self._field_values[name]
-        return super().__getattribute__(name)
+    def byte_size(self):
+        """Returns the number of bytes ``write`` produces for the model, without serializing it.
 
-    def __setattr__(self, name, value):
-        if name != '_field_values' and name in self._field_values:
-            self._field_values[name] = value
-        else:
-            super().__setattr__(name, value)
+        Sizes are not cached: subtrees that were not modified since a tracked or lazy read count as the length of
+        their original bytes, and the others are walked again on every call, since invalidating cached sizes would
+        cost every change a walk up the chain of owners (see ``dsvfile.Tracking.touch``).
+        """
+        if self._struct is not None:
+            return self._struct.size
+        size = 0
+        write_field = True
+        for fname, field in self._steps:
+            if not (write_field or field.always_read):
+                continue
+            if isinstance(field, FieldRun):
+                size += field.size
+            elif isinstance(field, ConditionalBlockStart):
+                write_field = field.read(None, self)
+            elif isinstance(field, ConditionalBlockEnd):
+                write_field = True
+            elif field.write_value:
+                size += field.byte_size(getattr(self, fname), self)
+        return size
+
+    @classmethod
+    def _variant(cls, mixin, prefix):
+        """Returns the cached subclass of the class combining it with a mixin such as ``LazyModel``."""
+        attribute = '_{0}_class'.format(prefix.lower())
+        variant = cls.__dict__.get(attribute)
+        if variant is None:
+            variant = type(cls)(prefix + cls.__name__, (mixin, cls),
+                                {'__slots__': mixin.instance_slots, 'model_class': cls})
+            setattr(cls, attribute, variant)
+        return variant
+
+    @classmethod
+    def lazy(cls, buffer, start, end, **options):
+        """Creates an instance that parses ``buffer[start:end]`` the first time one of its fields is accessed."""
+        lazy_class = cls._variant(LazyModel, 'Lazy')
+        instance = lazy_class.__new__(lazy_class)
+        object.__setattr__(instance, '_source', (buffer, start, end, options))
+        return instance
 
     @property
     def field_list(self):
@@ -60,6 +281,192 @@ class Model(object):
         return self._fields
 
 
+def _tell(input_stream):
+    try:
+        return input_stream.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+def _read_projected_field(field, model, input_stream, patterns, path):
+    while isinstance(field, ConditionalField):
+        if not field._check_condition(model):
+            return None
+        field = field.field
+    if field.size is not None or any(pattern.contains(path) for pattern in patterns):
+        return field.read(input_stream, model)
+    if not any(pattern.leads_to(path) for pattern in patterns):
+        if not isinstance(field, (ModelField, ArrayField)):
+            return field.read(input_stream, model)
+        start = _tell(input_stream)
+        field.skip(input_stream, model)
+        return Unloaded(start, _tell(input_stream), getattr(input_stream, 'buffer', None))
+    if isinstance(field, ModelField):
+        local_model = field.model_class.__new__(field.model_class)
+        local_model._read_projected(input_stream, patterns, path)
+        return local_model
+    if isinstance(field, ArrayField):
+        return [_read_projected_field(field.item_field, model, input_stream, patterns, path + (index,))
+                for index in range(field._read_length(input_stream, model))]
+    return field.read(input_stream, model)
+
+
+def _read_tracked_model(model_class, input_stream, owner):
+    tracked_class = model_class._variant(TrackedModel, 'Tracked')
+    model = tracked_class.__new__(tracked_class)
+    start = input_stream.pos
+    model._track(owner, None, True)
+    model._read_tracked(input_stream)
+    return model._track(owner, (input_stream.buffer, start, input_stream.pos))
+
+
+def _read_tracked_field(field, model, input_stream):
+    while isinstance(field, ConditionalField):
+        if not field._check_condition(model):
+            return None
+        field = field.field
+    if isinstance(field, ModelField):
+        return _read_tracked_model(field.model_class, input_stream, model)
+    if not isinstance(field, ArrayField):
+        return field.read(input_stream, model)
+    start = input_stream.pos
+    length = field._read_length(input_stream, model)
+    item_field = field.item_field
+    if not isinstance(item_field, ModelField):
+        value = item_field.read_array(input_stream, length, model)
+        value = TrackedArray(value.typecode, value) if isinstance(value, array) else TrackedList(value)
+    elif item_field.model_class._struct is None:
+        value = TrackedList()
+        list.extend(value, [_read_tracked_model(item_field.model_class, input_stream, value) for i in range(length)])
+    else:
+        # Pool items are written along with the whole pool, so they do not need spans of their own
+        read_items = item_field.model_class._variant(TrackedModel, 'Tracked')._compile('read_tracked_items')
+        value = TrackedList()
+        list.extend(value, read_items(input_stream.read(item_field.size * length), value))
+    return value._track(model, (input_stream.buffer, start, input_stream.pos))
+
+
+def _plain_model(model_class, values):
+    model = model_class.__new__(model_class)
+    for fname, value in values.items():
+        setattr(model, fname, value)
+    return model
+
+
+def _reduce_plain(model):
+    """Pickles a lazy or tracked instance as an instance of its plain model class."""
+    values = {}
+    for fname in model._value_fields:
+        try:
+            values[fname] = getattr(model, fname)
+        except AttributeError:
+            pass
+    return _plain_model, (model.model_class, values)
+
+
+class LazyModel(object):
+    """Mixin of the classes created by ``Model.lazy``.
+
+    The field slots of a lazy instance stay empty until it is loaded, so the first access to any of them falls
+    through to ``__getattr__`` and parses the recorded byte range. An instance that has never been loaded is
+    written back as the original bytes. Lazy instances are loaded and pickled as plain ones.
+    """
+    __slots__ = ()
+    instance_slots = ('_source',)
+
+    @property
+    def loaded(self):
+        return self._source is None
+
+    def load(self):
+        source = self._source
+        if source is not None:
+            object.__setattr__(self, '_source', None)
+            buffer, start, end, options = source
+            self.read(BufferReader(buffer, start, **options))
+
+    def adopt(self, model):
+        """Loads the instance by taking over the values of a model parsed elsewhere."""
+        object.__setattr__(self, '_source', None)
+        for fname in self._value_fields:
+            object.__setattr__(self, fname, getattr(model, fname))
+
+    def write(self, output_stream):
+        source = self._source
+        if source is not None:
+            buffer, start, end, options = source
+            output_stream.write(buffer[start:end])
+        else:
+            super().write(output_stream)
+
+    def byte_size(self):
+        source = self._source
+        if source is not None:
+            buffer, start, end, options = source
+            return end - start
+        return super().byte_size()
+
+    def __reduce_ex__(self, protocol):
+        return _reduce_plain(self)
+
+    def __getattr__(self, name):
+        if name in self._value_fields and self._source is not None:
+            self.load()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if self._source is not None:
+            self.load()
+        object.__setattr__(self, name, value)
+
+
+class TrackedModel(object):
+    """Mixin of the classes of the instances created by a tracked read (see ``Model.read``).
+
+    Setting a field marks the instance as modified, along with the lists and models containing it. An unmodified
+    instance that knows the bytes it was read from is written back as a copy of them. Tracked instances are
+    pickled as plain ones.
+    """
+    __slots__ = ()
+    instance_slots = ('_owner', '_span', '_dirty')
+
+    def _track(self, owner, span, dirty=False):
+        object.__setattr__(self, '_owner', owner)
+        object.__setattr__(self, '_span', span)
+        object.__setattr__(self, '_dirty', dirty)
+        return self
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def touch(self):
+        """Marks the instance as modified, e.g. after changing one of its arrays through a NumPy view."""
+        touch(self)
+
+    def write(self, output_stream):
+        if self._dirty or self._span is None:
+            super().write(output_stream)
+        else:
+            buffer, start, end = self._span
+            output_stream.write(buffer[start:end])
+
+    def byte_size(self):
+        if self._dirty or self._span is None:
+            return super().byte_size()
+        buffer, start, end = self._span
+        return end - start
+
+    def __reduce_ex__(self, protocol):
+        return _reduce_plain(self)
+
+    def __setattr__(self, name, value):
+        if not self._dirty:
+            touch(self)
+        object.__setattr__(self, name, value)
+
+
 class Int32KVP(Model):
     key = Int32Field()
     value = Int32Field()
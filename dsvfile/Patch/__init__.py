@@ -0,0 +1,58 @@
+from mmap import mmap as memory_map
+from struct import pack_into, unpack_from
+from ..Fields import ConditionalField
+from ..Models.GameSave import GameSave
+from ..Paths import PathPattern, format_path, resolve_field, iter_spans
+from ..Streams import BufferReader
+
+
+__all__ = ['locate', 'patch']
+
+
+def locate(buffer, pattern, model_class=GameSave):
+    """Yields ``(path, offset, format)`` for each fixed-size value matching a path pattern in a buffer holding a save.
+
+    ``offset`` is the absolute offset of the value in the buffer and ``format`` its ``struct`` format. The save is
+    walked with skip passes that only descend along the pattern. Values other fields depend on (lengths and
+    condition arguments) are refused, as changing them would make the rest of the save unreadable.
+    """
+    pattern = PathPattern(pattern)
+    for path, field, start, end in iter_spans(model_class, BufferReader(buffer), pattern.leads_to):
+        if not pattern.matches(path) or start == end:
+            continue
+        while isinstance(field, ConditionalField):
+            field = field.field
+        if field.fmt is None:
+            raise TypeError('{0} is not a fixed-size value'.format(format_path(path)))
+        if isinstance(path[-1], str) and path[-1] in _parent_model(model_class, path)._references:
+            raise ValueError('{0} is a length or condition other fields depend on'.format(format_path(path)))
+        yield path, start, field.fmt
+
+
+def _parent_model(model_class, path):
+    field = resolve_field(model_class, path[:-1])
+    while isinstance(field, ConditionalField):
+        field = field.field
+    return field.model_class
+
+
+def patch(path, changes, model_class=GameSave):
+    """Overwrites fixed-size values of a save file in place, through a writable memory map of it.
+
+    ``changes`` maps path patterns to new values, or to functions computing the new value from the old one. Nothing
+    else in the file is parsed or rewritten. Returns the number of values written.
+    """
+    with open(path, 'r+b') as f:
+        buffer = memory_map(f.fileno(), 0)
+        try:
+            # Every pattern is resolved before anything is written, so that an invalid one leaves the file untouched
+            targets = [(offset, fmt, value) for pattern, value in changes.items()
+                       for value_path, offset, fmt in locate(buffer, pattern, model_class)]
+            for offset, fmt, value in targets:
+                if callable(value):
+                    value = value(unpack_from(fmt, buffer, offset)[0])
+                pack_into(fmt, buffer, offset, value)
+            buffer.flush()
+        finally:
+            buffer.close()
+    return len(targets)
@@ -0,0 +1,131 @@
+import re
+from ..Fields import ArrayField, ModelField, ConditionalField
+
+
+__all__ = ['ANY_FIELD', 'ANY_INDEX', 'parse_path', 'format_path', 'PathPattern', 'resolve_field', 'iter_spans']
+
+
+ANY_FIELD = '*'
+ANY_INDEX = '[*]'
+
+_path_token = re.compile(r'\[(\*|\d+)\]|([^.\[\]]+)')
+
+
+def parse_path(path):
+    """Splits a path like ``gameData.planetFactory[3].factorySystem`` into a tuple of steps.
+
+    Field names become strings and array indices integers; ``*`` and ``[*]`` become ``ANY_FIELD`` and
+    ``ANY_INDEX``. Tuples are returned unchanged.
+    """
+    if isinstance(path, tuple):
+        return path
+    steps = []
+    for index, name in _path_token.findall(path):
+        if name:
+            steps.append(name)
+        elif index == '*':
+            steps.append(ANY_INDEX)
+        else:
+            steps.append(int(index))
+    return tuple(steps)
+
+
+def format_path(steps):
+    path = ''
+    for step in steps:
+        if isinstance(step, int) or step == ANY_INDEX:
+            path += '[{0}]'.format('*' if step == ANY_INDEX else step)
+        else:
+            path += ('.' if path else '') + step
+    return path
+
+
+def _step_matches(pattern_step, step):
+    if pattern_step == ANY_INDEX:
+        return isinstance(step, int)
+    if pattern_step == ANY_FIELD:
+        return isinstance(step, str)
+    return pattern_step == step
+
+
+class PathPattern(object):
+    """A path that may contain ``*`` (any field) and ``[*]`` (any index) wildcards."""
+
+    def __init__(self, pattern):
+        self.steps = parse_path(pattern)
+
+    def _prefix_matches(self, steps):
+        return all(_step_matches(pattern_step, step) for pattern_step, step in zip(self.steps, steps))
+
+    def matches(self, path):
+        """Whether the path is matched by the pattern."""
+        path = parse_path(path)
+        return len(path) == len(self.steps) and self._prefix_matches(path)
+
+    def contains(self, path):
+        """Whether the path is matched by the pattern or lies inside a subtree matched by it."""
+        path = parse_path(path)
+        return len(path) >= len(self.steps) and self._prefix_matches(path)
+
+    def leads_to(self, path):
+        """Whether the path is an ancestor of the paths matched by the pattern."""
+        path = parse_path(path)
+        return len(path) < len(self.steps) and self._prefix_matches(path)
+
+    def __repr__(self):
+        return 'PathPattern({0!r})'.format(format_path(self.steps))
+
+
+def resolve_field(model_class, path):
+    """Returns the field a concrete path refers to, starting from the given model class.
+
+    Array items resolve to the item field of the array, and conditional fields are looked through.
+    """
+    field = ModelField(model_class)
+    for step in parse_path(path):
+        while isinstance(field, ConditionalField):
+            field = field.field
+        if isinstance(step, int):
+            if not isinstance(field, ArrayField):
+                raise KeyError(format_path(path) if isinstance(path, tuple) else path)
+            field = field.item_field
+        elif isinstance(field, ModelField) and step in field.model_class._fields:
+            field = field.model_class._fields[step]
+        else:
+            raise KeyError(format_path(path) if isinstance(path, tuple) else path)
+    return field
+
+
+def iter_spans(model_class, reader, descend=None, path=()):
+    """Walks a model in the reader with skip passes, yielding ``(path, field, start, end)`` for each of its fields.
+
+    Nested models and array items are visited when ``descend(path)`` is true for the path of the field holding
+    them; array items are yielded with the item field. The reader is left positioned after the model.
+    """
+    model = model_class.__new__(model_class)
+    for fname, start, end in model.scan(reader):
+        field = model_class._fields[fname]
+        field_path = path + (fname,)
+        yield field_path, field, start, end
+        if descend is not None and descend(field_path):
+            position = reader.tell()
+            reader.seek(start)
+            yield from _iter_field_spans(field, model, reader, descend, field_path)
+            reader.seek(position)
+
+
+def _iter_field_spans(field, model, reader, descend, path):
+    if isinstance(field, ConditionalField):
+        if field._check_condition(model):
+            yield from _iter_field_spans(field.field, model, reader, descend, path)
+    elif isinstance(field, ModelField):
+        yield from iter_spans(field.model_class, reader, descend, path)
+    elif isinstance(field, ArrayField):
+        for index, (start, end) in enumerate(field.scan(reader, model)):
+            item_path = path + (index,)
+            yield item_path, field.item_field, start, end
+            if descend(item_path):
+                position = reader.tell()
+                reader.seek(start)
+                yield from _iter_field_spans(field.item_field, model, reader, descend, item_path)
+                reader.seek(position)
@@ -0,0 +1,85 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+__all__ = ['ColumnarPool', 'record_dtype']
+
+
+_dtypes = {}
+
+
+def record_dtype(model_class):
+    """Returns the packed little-endian NumPy structured dtype matching a fixed-layout model."""
+    if numpy is None:
+        raise ImportError('Columnar pools require NumPy')
+    if model_class._struct is None:
+        raise TypeError('{0} does not have a fixed binary layout'.format(model_class.__name__))
+    dtype = _dtypes.get(model_class)
+    if dtype is None:
+        dtype = numpy.dtype([(fname, model_class._fields[fname].dtype) for fname in model_class._value_fields])
+        _dtypes[model_class] = dtype
+    return dtype
+
+
+class ColumnarPool(object):
+    """A pool of fixed-layout records backed by a NumPy structured array.
+
+    Indexing with a field name returns the column, indexing with an integer returns the record materialized
+    as a model instance. Arrays loaded straight from a save buffer are read-only and get copied on the first
+    assignment.
+    """
+
+    def __init__(self, model_class, array):
+        self.model_class = model_class
+        self.array = array
+
+    @classmethod
+    def frombuffer(cls, model_class, buffer, length):
+        return cls(model_class, numpy.frombuffer(buffer, dtype=record_dtype(model_class), count=length))
+
+    @classmethod
+    def from_models(cls, model_class, models):
+        getter = model_class._values_getter
+        return cls(model_class, numpy.array([getter(item) for item in models], dtype=record_dtype(model_class)))
+
+    @property
+    def columns(self):
+        return self.array.dtype.names
+
+    def tobytes(self):
+        return self.array.tobytes()
+
+    def to_list(self):
+        return [self._materialize(record) for record in self.array.tolist()]
+
+    def _materialize(self, values):
+        item = self.model_class.__new__(self.model_class)
+        for name, value in zip(self.model_class._value_fields, values):
+            setattr(item, name, value)
+        return item
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.array[key]
+        if isinstance(key, slice):
+            return self.__class__(self.model_class, self.array[key])
+        return self._materialize(self.array[key].item())
+
+    def __setitem__(self, key, value):
+        if not self.array.flags.writeable:
+            self.array = self.array.copy()
+        if isinstance(key, str):
+            self.array[key] = value
+        else:
+            self.array[key] = self.model_class._values_getter(value)
+
+    def __repr__(self):
+        return '<{0} of {1} x {2}>'.format(self.__class__.__name__, len(self), self.model_class.__name__)
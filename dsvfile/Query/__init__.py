@@ -0,0 +1,205 @@
+from ..Export import pool_paths, pool_columns, gather, pool_owners, unwrap
+from ..Fields import ConditionalField, EnumField, ModelField
+from ..Models.GameData import GameData
+from ..Pools import numpy
+
+
+__all__ = ['Query', 'Grouped', 'find_pool']
+
+
+def find_pool(name):
+    """Returns the full name of a pool (see ``dsvfile.Export.gather``), the column identifying the factory or Dyson
+    sphere of its rows and the model class of its items, from its full name or the last parts of it
+    (``assemblerPool``, ``powerSystem.genPool``).
+    """
+    matches = []
+    for array_name, key in pool_owners:
+        item_class = unwrap(GameData._fields[array_name].item_field).model_class
+        for path, model_class in pool_paths(item_class):
+            full_name = '.'.join((array_name,) + path)
+            if full_name == name or full_name.endswith('.' + name):
+                matches.append((full_name, key, model_class))
+    if not matches:
+        raise KeyError(name)
+    if len(matches) > 1:
+        raise KeyError('{0} is ambiguous: {1}'.format(name, ', '.join(match[0] for match in matches)))
+    return matches[0]
+
+
+def _column_field(model_class, name):
+    """Returns the field a column (``recipeId``, ``storage.itemId``, ...) of a pool of a model class comes from."""
+    *steps, fname = name.split('.')
+    for step in steps:
+        model_class = unwrap(model_class._fields[step]).model_class
+    return unwrap(model_class._fields[fname])
+
+
+def _id_column(model_class):
+    """Returns the column holding the ids of the items of a pool, which are 0 in freed slots: ``id``, or the ``id`` of
+    the model held by switch items (``stationPool.id`` for the ``StationComponentSwitch`` items of ``stationPool``).
+    """
+    if 'id' in model_class._fields:
+        return 'id'
+    for fname in model_class._value_fields:
+        field = model_class._fields[fname]
+        if isinstance(field, ConditionalField) and isinstance(unwrap(field), ModelField):
+            if 'id' in unwrap(field).model_class._fields:
+                return fname + '.id'
+    return None
+
+
+class Query(object):
+    """A selection of the rows of a pool gathered from every planet factory (or Dyson sphere) of a save.
+
+    The pool is loaded as NumPy columns once (see ``dsvfile.Export.gather``); ``where`` and ``group_by`` return new
+    queries and groupings over the same columns, so that a query can be refined and reused without gathering again.
+    Freed slots (rows with an ``id`` of 0, see ``_id_column``) are left out.
+    """
+
+    def __init__(self, save, pool):
+        self.pool, key, self.model_class = find_pool(pool)
+        columns = gather(save, (self.pool,)).get(self.pool)
+        if columns is None:
+            columns = pool_columns(self.model_class, [])
+            columns[key] = numpy.zeros(0, dtype='<i4')
+        self.columns = columns
+        id_column = _id_column(self.model_class)
+        self.mask = columns[id_column] != 0 if id_column in columns else None
+
+    def _derive(self, mask):
+        query = object.__new__(type(self))
+        query.pool, query.model_class, query.columns, query.mask = self.pool, self.model_class, self.columns, mask
+        return query
+
+    def column(self, name):
+        """Returns a number column of the pool, over all of its rows."""
+        try:
+            column = self.columns[name]
+        except KeyError:
+            raise KeyError('{0} has no column {1}'.format(self.pool, name))
+        if isinstance(column, tuple):
+            raise TypeError('{0} holds arrays, it cannot be compared or aggregated'.format(name))
+        return column
+
+    def _value(self, name, value):
+        if isinstance(value, str):
+            field = _column_field(self.model_class, name)
+            if isinstance(field, EnumField):
+                for number, enum_name in field.enum_values.items():
+                    if enum_name == value:
+                        return number
+            raise ValueError('{0} is not a value of {1}'.format(value, name))
+        return value
+
+    def where(self, *masks, **conditions):
+        """Returns the rows of this query matching every condition.
+
+        Conditions are given by column name: a value (or the name of an enum value, such as
+        ``recipeId='Processor'``), a collection of values any of which may match, or a function taking the column
+        and returning a mask (``speed=lambda speed: speed > 10000``). Masks computed from ``column`` can be given
+        as positional arguments.
+        """
+        mask = self.mask
+        for name, condition in conditions.items():
+            column = self.column(name)
+            if callable(condition):
+                matches = condition(column)
+            elif isinstance(condition, (list, tuple, set, frozenset)):
+                matches = numpy.isin(column, [self._value(name, value) for value in condition])
+            else:
+                matches = column == self._value(name, condition)
+            mask = matches if mask is None else mask & matches
+        for matches in masks:
+            mask = matches if mask is None else mask & matches
+        return self._derive(mask)
+
+    def indexes(self):
+        """Returns the positions of the selected rows in the columns."""
+        if self.mask is None:
+            return numpy.arange(len(next(iter(self.columns.values()))))
+        return numpy.flatnonzero(self.mask)
+
+    def count(self):
+        if self.mask is None:
+            return len(self.indexes())
+        return int(numpy.count_nonzero(self.mask))
+
+    def __len__(self):
+        return self.count()
+
+    def select(self, *names):
+        """Returns the selected rows as a dict of columns, for the given column names or all of them.
+
+        Columns holding arrays are returned as lists with the array of each row.
+        """
+        indexes = self.indexes()
+        selected = {}
+        for name in names or self.columns:
+            if name not in self.columns:
+                raise KeyError('{0} has no column {1}'.format(self.pool, name))
+            column = self.columns[name]
+            if isinstance(column, tuple):
+                offsets, values = column
+                selected[name] = [values[offsets[index]:offsets[index + 1]] for index in indexes.tolist()]
+            else:
+                selected[name] = column[indexes]
+        return selected
+
+    def rows(self, *names):
+        """Returns the selected rows as a list of tuples of the values of the given number columns, or of all of
+        them.
+        """
+        if not names:
+            names = tuple(name for name, column in self.columns.items() if not isinstance(column, tuple))
+        columns = self.select(*names)
+        return list(zip(*(columns[name].tolist() for name in names)))
+
+    def group_by(self, *names):
+        return Grouped(self, names)
+
+
+class Grouped(object):
+    """The rows of a query grouped by the values of some columns; each aggregate returns a dict of columns holding the
+    values of the grouping columns and the aggregated values of each group, ordered by group.
+    """
+
+    def __init__(self, query, names):
+        self.query = query
+        self.names = names
+        self.indexes = query.indexes()
+        keys = numpy.empty(len(self.indexes), dtype=[(name, query.column(name).dtype) for name in names])
+        for name in names:
+            keys[name] = query.column(name)[self.indexes]
+        self.keys, self.groups = numpy.unique(keys, return_inverse=True)
+        self.groups = self.groups.reshape(-1)
+
+    def _result(self, values):
+        result = {name: self.keys[name] for name in self.names}
+        result.update(values)
+        return result
+
+    def count(self):
+        return self._result({'count': numpy.bincount(self.groups, minlength=len(self.keys))})
+
+    def sum(self, *names):
+        return self._reduce(numpy.add, names)
+
+    def mean(self, *names):
+        counts = numpy.bincount(self.groups, minlength=len(self.keys))
+        sums = self.sum(*names)
+        return self._result({name: sums[name] / counts for name in names})
+
+    def min(self, *names):
+        return self._reduce(numpy.minimum, names)
+
+    def max(self, *names):
+        return self._reduce(numpy.maximum, names)
+
+    def _values(self, name):
+        return self.query.column(name)[self.indexes]
+
+    def _reduce(self, function, names):
+        order = numpy.argsort(self.groups, kind='stable')
+        starts = numpy.flatnonzero(numpy.diff(self.groups[order], prepend=-1))
+        return self._result({name: function.reduceat(self._values(name)[order], starts) if len(order) else
+                             self._values(name) for name in names})
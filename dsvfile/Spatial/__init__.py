@@ -0,0 +1,108 @@
+from math import floor
+from ..Export import pool_columns
+from ..Pools import numpy
+
+
+__all__ = ['SpatialIndex']
+
+
+class SpatialIndex(object):
+    """A grid of the positions of the items of a pool, answering radius and nearest neighbour queries with ids.
+
+    The positions are binned into cubic cells of ``cell_size`` (by default about two items per cell on the surface of
+    the planet), sorted by cell, so that a query only measures the distances to the items of the cells around the
+    point, with NumPy. Distances are straight-line distances between ``(pos_x, pos_y, pos_z)`` positions.
+    """
+
+    def __init__(self, ids, positions, cell_size=None):
+        if numpy is None:
+            raise ImportError('Spatial indexes require NumPy')
+        ids = numpy.asarray(ids)
+        positions = numpy.asarray(positions, dtype='<f8').reshape(-1, 3)
+        if cell_size is None:
+            radius = numpy.sqrt((positions ** 2).sum(axis=1).max()) if len(positions) else 1.0
+            cell_size = max(numpy.sqrt(4 * numpy.pi * radius ** 2 / max(len(positions), 1)) * 1.5, 1e-3)
+        self.cell_size = float(cell_size)
+        cells = numpy.floor(positions / self.cell_size).astype('<i8')
+        origin = cells.min(axis=0) if len(cells) else numpy.zeros(3, dtype='<i8')
+        cells -= origin
+        self.origin = tuple(origin.tolist())
+        self.shape = tuple((cells.max(axis=0) + 1).tolist()) if len(cells) else (1, 1, 1)
+        keys = self._keys(cells[:, 0], cells[:, 1], cells[:, 2])
+        order = numpy.argsort(keys, kind='stable')
+        self.ids = ids[order]
+        self.positions = positions[order]
+        self.cell_keys, self.cell_starts, counts = numpy.unique(keys[order], return_index=True, return_counts=True)
+        self.cell_ends = self.cell_starts + counts
+
+    @classmethod
+    def from_pool(cls, model_class, items, cell_size=None):
+        """Indexes the items of a pool of models with ``id`` and ``pos_x``, ``pos_y``, ``pos_z`` fields (entities,
+        prebuilds, vegetation, veins), leaving out freed slots.
+        """
+        columns = pool_columns(model_class, items)
+        used = columns['id'] != 0
+        positions = numpy.stack([columns['pos_x'][used], columns['pos_y'][used], columns['pos_z'][used]], axis=1)
+        return cls(columns['id'][used], positions, cell_size)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keys(self, x, y, z):
+        return (x * self.shape[1] + y) * self.shape[2] + z
+
+    def _candidates(self, point, radius):
+        """Returns the positions in the sorted arrays of the items of the cells overlapping a cube around a point."""
+        bounds = []
+        for axis, coordinate in enumerate(point.tolist()):
+            low = max(floor((coordinate - radius) / self.cell_size) - self.origin[axis], 0)
+            high = min(floor((coordinate + radius) / self.cell_size) - self.origin[axis], self.shape[axis] - 1)
+            if low > high:
+                return numpy.zeros(0, dtype='<i8')
+            bounds.append(numpy.arange(low, high + 1))
+        if len(bounds[0]) * len(bounds[1]) * len(bounds[2]) >= len(self.cell_keys):
+            return numpy.arange(len(self.ids))
+        keys = self._keys(bounds[0][:, None, None], bounds[1][None, :, None], bounds[2][None, None, :]).ravel()
+        found = numpy.minimum(numpy.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = found[self.cell_keys[found] == keys]
+        starts, ends = self.cell_starts[found], self.cell_ends[found]
+        lengths = ends - starts
+        # Concatenated ranges starts[i]:ends[i]
+        return numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths) + numpy.arange(lengths.sum())
+
+    def _measure(self, point, candidates):
+        return numpy.sqrt(((self.positions[candidates] - point) ** 2).sum(axis=1))
+
+    def within(self, point, radius, distances=False):
+        """Returns the ids of the items at most ``radius`` away from a point, nearest first, and their distances with
+        ``distances``.
+        """
+        point = numpy.asarray(point, dtype='<f8')
+        candidates = self._candidates(point, radius)
+        measured = self._measure(point, candidates)
+        inside = measured <= radius
+        candidates, measured = candidates[inside], measured[inside]
+        order = numpy.argsort(measured, kind='stable')
+        if distances:
+            return self.ids[candidates[order]], measured[order]
+        return self.ids[candidates[order]]
+
+    def nearest(self, point, k=1, distances=False):
+        """Returns the ids of the ``k`` items nearest to a point, nearest first, and their distances with
+        ``distances``.
+        """
+        point = numpy.asarray(point, dtype='<f8')
+        k = min(k, len(self.ids))
+        radius = self.cell_size
+        while True:
+            candidates = self._candidates(point, radius)
+            if len(candidates) >= k:
+                measured = self._measure(point, candidates)
+                order = numpy.argsort(measured, kind='stable')[:k]
+                # Items farther than the radius may be outside of the cells searched, and nearer than those found
+                if len(candidates) == len(self.ids) or not k or measured[order[-1]] <= radius:
+                    break
+            radius *= 2
+        if distances:
+            return self.ids[candidates[order]], measured[order]
+        return self.ids[candidates[order]]
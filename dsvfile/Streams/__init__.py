@@ -0,0 +1,165 @@
+from ..Pools import numpy
+
+
+__all__ = ['Reader', 'StreamReader', 'BufferReader', 'ChunkWriter', 'BufferWriter', 'Unloaded']
+
+
+class Reader(object):
+    """Base class of the objects models are read from; carries the options of a read operation."""
+    deferred = None
+
+    def __init__(self, columnar=False, lazy=False):
+        if columnar and numpy is None:
+            raise ImportError('Columnar reading requires NumPy')
+        self.columnar = columnar
+        self.lazy = lazy
+
+    def options(self):
+        return {'columnar': self.columnar, 'lazy': self.lazy}
+
+    def read(self, size):
+        raise NotImplementedError
+
+    def unpack(self, struct):
+        return struct.unpack(self.read(struct.size))
+
+    def skip(self, size):
+        self.read(size)
+
+
+class StreamReader(Reader):
+    """Wraps a binary input stream.
+
+    Any object providing ``read(n)`` can be wrapped; other attributes (``tell``, ``seek``, ...) are
+    forwarded to the underlying stream.
+    """
+
+    def __init__(self, stream, **options):
+        super().__init__(**options)
+        if self.lazy:
+            raise ValueError('Lazy reading requires a buffer, use BufferReader or GameSave.open')
+        self.stream = stream
+        self.read = stream.read
+
+    def skip(self, size):
+        try:
+            self.stream.seek(size, 1)
+        except (AttributeError, OSError):
+            self.read(size)
+
+    def __getattr__(self, name):
+        if name == 'stream':
+            raise AttributeError(name)
+        return getattr(self.stream, name)
+
+
+class BufferReader(Reader):
+    """Reads from an in-memory buffer (``bytes``, ``bytearray``, ``mmap``, ...) through an explicit offset cursor.
+
+    ``read`` returns zero-copy ``memoryview`` slices of the buffer (or ``bytes`` copies when ``zero_copy`` is
+    disabled) and ``unpack`` decodes in place with ``unpack_from``. ``path`` is the file the buffer maps, if any.
+    """
+
+    def __init__(self, buffer, offset=0, path=None, zero_copy=True, **options):
+        super().__init__(**options)
+        self.buffer = memoryview(buffer)
+        self.pos = offset
+        self.path = path
+        self.zero_copy = zero_copy
+
+    def read(self, size):
+        pos = self.pos
+        self.pos = pos + size
+        if self.zero_copy:
+            return self.buffer[pos:pos + size]
+        return self.buffer[pos:pos + size].tobytes()
+
+    def unpack(self, struct):
+        values = struct.unpack_from(self.buffer, self.pos)
+        self.pos += struct.size
+        return values
+
+    def skip(self, size):
+        self.pos += size
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += len(self.buffer)
+        self.pos = offset
+        return offset
+
+
+class ChunkWriter(object):
+    """An output stream keeping references to the written chunks instead of copying them, with their total size."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += data.nbytes if isinstance(data, memoryview) else len(data)
+
+    def write_to(self, output_stream):
+        for chunk in self.chunks:
+            output_stream.write(chunk)
+
+
+class BufferWriter(object):
+    """An output stream copying the written data into a preallocated writable buffer (``bytearray``, writable
+    ``mmap``, ...). ``pos`` is the offset the next write goes to.
+    """
+
+    def __init__(self, buffer, offset=0):
+        self.buffer = buffer
+        self.view = memoryview(buffer).cast('B')
+        self.pos = offset
+
+    def write(self, data):
+        if isinstance(data, memoryview) and data.format != 'B':
+            data = data.cast('B')
+        end = self.pos + len(data)
+        self.view[self.pos:end] = data
+        self.pos = end
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        """Releases the view of the buffer, so that a memory map can be closed."""
+        self.view.release()
+
+
+class Unloaded(object):
+    """Stands for a value skipped by a projected read (see ``Model.read``).
+
+    ``start`` and ``end`` are the stream offsets of the skipped bytes when the stream reports its position, and
+    ``buffer`` is the buffer they refer to when reading from one. In that case the value is written back as a
+    copy of the original bytes.
+    """
+    __slots__ = ('start', 'end', 'buffer')
+
+    def __init__(self, start=None, end=None, buffer=None):
+        self.start = start
+        self.end = end
+        self.buffer = buffer
+
+    @property
+    def raw(self):
+        if self.buffer is None:
+            raise ValueError('The bytes of a value skipped in a stream are not available, read from a buffer instead')
+        return self.buffer[self.start:self.end]
+
+    def write(self, output_stream):
+        output_stream.write(self.raw)
+
+    def byte_size(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return 'Unloaded({0}, {1})'.format(self.start, self.end)
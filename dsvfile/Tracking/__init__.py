@@ -0,0 +1,75 @@
+from array import array
+
+
+__all__ = ['touch', 'TrackedMixin', 'TrackedList', 'TrackedArray']
+
+
+def touch(obj):
+    """Marks a tracked model, list or array as modified, along with the chain of its owners."""
+    while obj is not None and not getattr(obj, '_dirty', True):
+        object.__setattr__(obj, '_dirty', True)
+        obj = obj._owner
+
+
+def _tracking(method):
+    def wrapper(self, *args):
+        if not self._dirty:
+            touch(self)
+        return method(self, *args)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class TrackedMixin(object):
+    """Common part of the containers created by a tracked read (see ``Model.read``).
+
+    ``_span`` holds the buffer the value was read from and its offsets in it, ``_owner`` the model or list
+    containing the value. While the value is not modified, ``raw`` returns its original bytes. Tracked values are
+    pickled as plain ones.
+    """
+    __slots__ = ()
+
+    def _track(self, owner, span, dirty=False):
+        self._owner = owner
+        self._span = span
+        self._dirty = dirty
+        return self
+
+    @property
+    def raw(self):
+        if self._dirty:
+            return None
+        buffer, start, end = self._span
+        return buffer[start:end]
+
+
+class TrackedList(TrackedMixin, list):
+    """A list that marks itself and its owners as modified when its content changes."""
+    __slots__ = ('_owner', '_span', '_dirty')
+
+    def sort(self, *, key=None, reverse=False):
+        if not self._dirty:
+            touch(self)
+        list.sort(self, key=key, reverse=reverse)
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
+class TrackedArray(TrackedMixin, array):
+    """An ``array.array`` that marks itself and its owners as modified when its content changes.
+
+    Writes through the buffer interface (``memoryview``, NumPy views, ...) are not tracked.
+    """
+    __slots__ = ('_owner', '_span', '_dirty')
+
+    def __reduce_ex__(self, protocol):
+        return array, (self.typecode, self.tobytes())
+
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop', 'remove',
+              'clear', 'reverse'):
+    setattr(TrackedList, _name, _tracking(getattr(list, _name)))
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop', 'remove',
+              'reverse', 'byteswap', 'frombytes', 'fromlist', 'fromfile'):
+    setattr(TrackedArray, _name, _tracking(getattr(array, _name)))
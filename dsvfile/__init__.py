@@ -1 +1,5 @@
 from .Models.GameSave import GameSave
+from .Index import SaveIndex
+from .Events import iterparse
+from .Diff import diff
+from .Archive import SaveArchive
@@ -8,4 +8,5 @@ setup(name='dsvfile',
       author='phoenixx-666',
       license='MIT',
       packages=find_packages(),
+      extras_require={'numpy': ['numpy']},
       zip_safe=False)